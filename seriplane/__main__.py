@@ -0,0 +1,8 @@
+"""`python seriplane <command>` from the repository root; see cli.py."""
+import os
+
+from cli import main
+
+if __name__ == "__main__":
+    # stage paths (data/, preprocessed/, models/, results/) live next to the code
+    main(default_workdir=os.path.dirname(os.path.abspath(__file__)))
@@ -1,11 +1,14 @@
-from flask import Flask, jsonify, send_file
-import subprocess
+from flask import Flask, jsonify, send_file, Response
+import json
 import os
-from datetime import datetime
+import history
+from jobs import JobManager
+from results_store import ResultsStore
 from flask import request
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RESULT_DIR = os.path.join(BASE_DIR, "results")
+history.HISTORY_DB = os.path.join(RESULT_DIR, "history.db")
 
 app = Flask(__name__, static_folder="static")
 
@@ -13,7 +16,6 @@ app = Flask(__name__, static_folder="static")
 def home():
     return app.send_static_file("index.html")
 
-from datetime import datetime
 from flask import request, jsonify
 import os
 
@@ -21,27 +23,14 @@ import os
 def home_reset():
     data = request.json or {}
 
-    # ---------------- SAVE LOGS ----------------
-    os.makedirs("logs", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-    # Save Evenness CSV
-    if data.get("evenness", "").strip():
-        with open(f"logs/evenness_{timestamp}.csv", "w") as f:
-            f.write(data["evenness"])
-
-    # Save Neatness & Cleanness CSV
-    if data.get("neatness", "").strip():
-        with open(f"logs/neatness_cleanness_{timestamp}.csv", "w") as f:
-            f.write(data["neatness"])
-
-    # ---------------- DELETE RESULT CSVs ----------------
-    for fpath in [
-        os.path.join(RESULT_DIR, "evenness.csv"),
-        os.path.join(RESULT_DIR, "neatness_cleanness.csv")
-    ]:
-        if os.path.exists(fpath):
-            os.remove(fpath)
+    # ---------------- SAVE EDITS ----------------
+    # the rows are already in the run history; the page only sends the
+    # cells changed by hand: {"run_id": ..., "evenness": [{"image", "column", "value"}], ...}
+    run_ids = data.get("run_id") or {}
+    for stage in history.STAGES:
+        edits = data.get(stage)
+        if isinstance(edits, list) and edits:
+            history.get_history().apply_edits(stage, edits, run_id=run_ids.get(stage))
 
     # ---------------- DELETE PREPROCESSED IMAGES ----------------
     PREPROCESSED_DIR = os.path.join(BASE_DIR, "preprocessed")
@@ -79,13 +68,61 @@ def home_reset():
     return jsonify({"status": "saved_all_and_reset"})
 
 
+def run_pipeline(progress):
+    # stages run in this process; imports and the YOLO model stay warm
+    from engine import get_engine
+    return get_engine().run(progress=progress)
+
+
+# one worker: queued /execute calls run one after another
+jobs = JobManager(run_pipeline)
+
+
 @app.route("/execute", methods=["POST"])
 def execute_pipeline():
-    subprocess.run(["python", "pipeline.py"], check=True)
-    return jsonify({"status": "Pipeline executed"})
+    job = jobs.submit()
+    return jsonify({
+        "status": "queued",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    status = job.to_dict()
+    if job.status == "done":
+        status["results"] = {"evenness": "/csv/evenness", "neatness": "/csv/neatness"}
+    return jsonify(status)
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def stream():
+        for event in jobs.events(job):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
 
 @app.route("/csv/<name>")
 def get_csv(name):
+    """
+    Result rows streamed from the run history: the latest run, or
+    ?run=<id>, ?since= / ?until= (YYYY-MM-DD), ?image=, ?defect=<class>.
+    """
     if name == "evenness":
         file_path = os.path.join(RESULT_DIR, "evenness.csv")
     elif name == "neatness":
@@ -93,11 +130,54 @@ def get_csv(name):
     else:
         return "Invalid CSV", 404
 
-    if not os.path.exists(file_path):
-        return "", 204   # No Content (important)
+    store = history.get_history()
+    filters = {k: request.args.get(k) for k in ("run", "since", "until", "image", "defect")}
+    if not any(filters.values()):
+        filters["run"] = store.latest_run(name)
+        if filters["run"] is None:
+            # results from before the history existed
+            if os.path.exists(file_path):
+                return send_file(file_path, mimetype="text/csv")
+            return "", 204   # No Content (important)
+
+    if store.count(name, **filters) == 0:
+        return "", 204
+
+    headers = {"X-Run-Id": filters["run"]} if filters["run"] else {}
+    return Response(store.iter_csv(name, **filters), mimetype="text/csv", headers=headers)
+
+
+@app.route("/runs")
+def get_runs():
+    """Recent runs with their row counts (?limit=, default 50)."""
+    return jsonify(history.get_history().runs(request.args.get("limit", 50, type=int)))
+
+
+results = ResultsStore()
+
+
+@app.route("/results/<stage>")
+def get_results(stage):
+    """Stored regions / boxes for a stage, optionally ?image=<strip name>."""
+    return jsonify(results.query(stage, request.args.get("image")))
+
+
+@app.route("/render/<stage>/<image>")
+def render_image(stage, image):
+    """Annotated strip drawn from the stored results (cached after the first call)."""
+    import render
+    path = render.render(stage, image, request.args.get("comparator"), store=results)
+    if path is None:
+        return "Not found", 404
+    return send_file(os.path.abspath(path), mimetype="image/jpeg")
+
 
-    return send_file(file_path, mimetype="text/csv")
+@app.route("/metrics")
+def get_metrics():
+    """Stage timings and counters in the Prometheus text format."""
+    import metrics
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
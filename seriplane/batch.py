@@ -0,0 +1,67 @@
+"""
+Order-preserving parallel batch runner for the seriplane stages.
+
+imap_ordered() fans a per-image function out over a process pool (or a
+thread pool for work that releases the GIL inside OpenCV) and yields the
+results in input order, so CSV rows still follow the sorted file order.
+Only a bounded number of images is in flight at any time, which lets a
+batch of any size stream through without holding everything in memory.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+
+# default worker count for crop / evenness batches (None = every core)
+WORKERS = None
+
+# images queued per worker ahead of the one being collected
+PREFETCH_PER_WORKER = 2
+
+
+def resolve_workers(workers=None):
+    """Turn a workers setting (None / 0 = all cores) into a positive int."""
+    if workers is None:
+        workers = WORKERS
+    if not workers:
+        workers = os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def imap_ordered(func, items, workers=None, use_threads=False):
+    """
+    Yield func(item) for every item, in input order, running up to
+    `workers` calls at once. With one worker everything runs inline.
+    func must be a module-level function when processes are used.
+    """
+    workers = resolve_workers(workers)
+    if workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool_cls = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    max_in_flight = workers * PREFETCH_PER_WORKER
+
+    def submit(pool, item):
+        if use_threads:
+            return pool.submit(func, item)
+        # stage timings recorded in the worker come back with the result
+        return pool.submit(metrics.collect, func, item)
+
+    def collect(future):
+        if use_threads:
+            return future.result()
+        result, records = future.result()
+        metrics.merge(records)
+        return result
+
+    with pool_cls(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(submit(pool, item))
+            if len(pending) >= max_in_flight:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
@@ -0,0 +1,326 @@
+"""
+Benchmarks on synthetic plane images.
+
+    python cli.py bench [--quick] [--repeat N] [--out bench.json] [--compare old.json]
+
+The generator draws bright horizontal strips on a dark, noisy background,
+with darker / brighter bands inside each strip that evenness should flag.
+Everything is seeded, so every run times the same pixels. Each stage is
+timed at several image sizes:
+
+    crop        crop.process_image on a raw plane image (detect, rotate, save)
+    evenness    evenness.process_image on a strip (decode, stats, regions, render)
+    regions     compute_regions_from_comparator on a strip's column means
+    neatness    neatness.run_batch_arrays on a batch of strips
+    predict     the yolo /predict path: JPEG decode, model server, plot, JPEG encode
+
+neatness and predict use models/best.pt when it and ultralytics are
+available. Otherwise they use StubDetector, which does the real
+letterbox pre-processing and returns fixed boxes, so the measured time
+is the pipeline around the model.
+
+Results are written as JSON. --compare prints the change against an
+earlier file and exits with 1 if any median is more than --tolerance
+slower.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# ===================== SETTINGS =====================
+# the sample images are 2126 x 1358 with two strips of ~3900 x 1100 after crop
+PLANE_SIZES = [(1063, 679), (2126, 1358), (4252, 2716)]    # raw image W x H
+STRIP_HEIGHTS = [2000, 3900, 7800]                        # strips are crop.target_width wide
+NEATNESS_BATCH = 4
+REPEAT = 5
+TOLERANCE = 0.2            # --compare: slower by more than this fraction = regression
+SEED = 0
+# ====================================================
+
+
+# --------------------------------------------------
+# SYNTHETIC IMAGES
+# --------------------------------------------------
+def make_strip(height, width=1100, uneven=((0.30, 0.36, -25), (0.70, 0.74, 30)),
+               brightness=150, noise=6, seed=SEED):
+    """
+    One preprocessed-looking strip (BGR). uneven holds (start, end, delta)
+    column ranges as fractions of the width whose brightness is shifted by delta.
+    """
+    rng = np.random.default_rng(seed)
+    profile = np.full(width, float(brightness))
+    for start, end, delta in uneven:
+        profile[int(start * width):int(end * width)] += delta
+    gray = profile[None, :] + rng.normal(0, noise, (height, width))
+    gray = np.clip(gray, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def make_plane_image(width, height, n_strips=2, strip_frac=0.4,
+                     uneven=((0.30, 0.36, -25), (0.70, 0.74, 30)),
+                     background=20, brightness=150, noise=6, seed=SEED):
+    """
+    Raw plane image (BGR): n_strips bright horizontal bands of strip_frac * height
+    rows on a dark background. Inside each band, uneven (start, end, delta)
+    row ranges, as fractions of the band, are shifted by delta; after crop's
+    rotation these are the columns evenness compares.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.full(height, float(background))
+    band = max(1, int(strip_frac * height))
+    gap = (height - n_strips * band) // (n_strips + 1)
+    for i in range(n_strips):
+        y0 = gap + i * (band + gap)
+        rows[y0:y0 + band] = brightness
+        for start, end, delta in uneven:
+            rows[y0 + int(start * band):y0 + int(end * band)] += delta
+
+    gray = rows[:, None] + rng.normal(0, noise, (height, width))
+    gray = np.clip(gray, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+# --------------------------------------------------
+# STUB MODEL
+# --------------------------------------------------
+class StubDetector:
+    """Stands in for YOLO: real letterbox pre-processing, three fixed boxes per image."""
+
+    names = {0: "minor", 1: "major", 2: "neatness"}
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path
+
+    def __call__(self, imgs, verbose=False):
+        from onnx_backend import Boxes, Result, preprocess
+
+        if isinstance(imgs, np.ndarray):
+            imgs = [imgs]
+        preprocess(imgs)
+        results = []
+        for img in imgs:
+            h, w = img.shape[:2]
+            xyxy = np.array([[0.1 * w, 0.1 * h, 0.2 * w, 0.15 * h],
+                             [0.5 * w, 0.4 * h, 0.6 * w, 0.5 * h],
+                             [0.7 * w, 0.8 * h, 0.9 * w, 0.85 * h]], dtype=np.float32)
+            boxes = Boxes(xyxy, np.array([0.9, 0.8, 0.7], np.float32), np.array([0, 1, 2], np.int64))
+            results.append(Result(img, boxes, self.names))
+        return results
+
+
+def real_model_available(model_path):
+    return os.path.exists(model_path) and importlib.util.find_spec("ultralytics") is not None
+
+
+# --------------------------------------------------
+# TIMING
+# --------------------------------------------------
+def timeit(fn, repeat=REPEAT, warmup=1):
+    """Wall-clock seconds of fn() over `repeat` runs (after `warmup` untimed runs)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            fn()
+        runs = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - t0)
+    return {
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "mean": statistics.fmean(runs),
+        "max": max(runs),
+        "repeat": repeat,
+    }
+
+
+def bench_crop(sizes, repeat):
+    import crop
+
+    out = {}
+    for w, h in sizes:
+        path = os.path.join("data", f"plane_{w}x{h}.png")
+        cv2.imwrite(path, make_plane_image(w, h))
+        out[f"{w}x{h}"] = timeit(lambda: crop.process_image(path), repeat)
+    return out
+
+
+def bench_evenness(heights, repeat):
+    import evenness
+
+    out = {}
+    for h in heights:
+        path = os.path.join("preprocessed", f"strip_{h}.jpg")
+        cv2.imwrite(path, make_strip(h))
+        out[f"1100x{h}"] = timeit(lambda: evenness.process_image(path), repeat)
+    return out
+
+
+def bench_regions(heights, repeat):
+    import evenness
+
+    out = {}
+    for h in heights:
+        gray = cv2.cvtColor(make_strip(h), cv2.COLOR_BGR2GRAY)
+        local_means = evenness.sliding_mean(evenness.column_profile(gray))
+        num_cols = gray.shape[1] // evenness.column_width
+        value = float(gray.mean())
+        out[f"1100x{h}"] = timeit(lambda: evenness.compute_regions_from_comparator(
+            local_means, value, num_cols, evenness.min_cols_for_defect), repeat)
+    return out
+
+
+def bench_neatness(heights, repeat, use_stub):
+    import neatness
+
+    if use_stub:
+        neatness.INFERENCE_BACKEND = StubDetector
+    neatness.OUTPUT_DIR = os.path.join("results", "neatness")
+    neatness.CSV_LOG = os.path.join("results", "neatness_cleanness.csv")
+
+    out = {}
+    for h in heights:
+        strips = [(f"strip_{h}_{i}.jpg", make_strip(h, seed=SEED + i)) for i in range(NEATNESS_BATCH)]
+        out[f"{NEATNESS_BATCH}x1100x{h}"] = timeit(lambda: neatness.run_batch_arrays(strips), repeat)
+    return out
+
+
+def bench_predict(sizes, repeat, use_stub):
+    import neatness
+    from model_server import ModelServer
+
+    server = ModelServer(neatness.MODEL_PATH, backend=StubDetector if use_stub else "ultralytics")
+    out = {}
+    try:
+        for w, h in sizes:
+            ok, buf = cv2.imencode(".jpg", make_plane_image(w, h))
+            data = buf.tobytes()
+
+            def predict():
+                img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                result = server.predict(img)
+                cv2.imencode(".jpg", result.plot())
+
+            out[f"{w}x{h}"] = timeit(predict, repeat)
+    finally:
+        server.close()
+    return out
+
+
+STAGES = ["crop", "evenness", "regions", "neatness", "predict"]
+
+
+def run(stages=STAGES, plane_sizes=PLANE_SIZES, strip_heights=STRIP_HEIGHTS,
+        repeat=REPEAT, workdir=None):
+    """Run the benchmarks in a scratch folder; returns the JSON-able report."""
+    import neatness   # MODEL_PATH resolves against the original working dir
+
+    use_stub = not real_model_available(neatness.MODEL_PATH)
+    home = os.getcwd()
+    workdir = workdir or tempfile.mkdtemp(prefix="seriplane_bench_")
+    report = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "model": "stub" if use_stub else neatness.MODEL_PATH,
+        "results": {},
+    }
+
+    os.chdir(workdir)
+    try:
+        for folder in ("data", "preprocessed", "results"):
+            os.makedirs(folder, exist_ok=True)
+        for stage in stages:
+            t0 = time.perf_counter()
+            if stage == "crop":
+                res = bench_crop(plane_sizes, repeat)
+            elif stage == "evenness":
+                res = bench_evenness(strip_heights, repeat)
+            elif stage == "regions":
+                res = bench_regions(strip_heights, repeat)
+            elif stage == "neatness":
+                res = bench_neatness(strip_heights, repeat, use_stub)
+            elif stage == "predict":
+                res = bench_predict(plane_sizes, repeat, use_stub)
+            else:
+                raise ValueError(f"Unknown stage: {stage}")
+            report["results"][stage] = res
+            print(f"{stage:<9} done in {time.perf_counter() - t0:.1f}s")
+    finally:
+        os.chdir(home)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Print median changes against baseline; returns the list of regressions."""
+    regressions = []
+    for stage, cases in report["results"].items():
+        for case, stats in cases.items():
+            old = baseline.get("results", {}).get(stage, {}).get(case)
+            if not old:
+                continue
+            change = stats["median"] / old["median"] - 1
+            flag = ""
+            if change > tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append((stage, case, change))
+            print(f"{stage:<9} {case:<16} {old['median'] * 1000:9.1f} ms -> "
+                  f"{stats['median'] * 1000:9.1f} ms  ({change:+.0%}){flag}")
+    return regressions
+
+
+def print_report(report):
+    print(f"\nmodel: {report['model']}")
+    for stage, cases in report["results"].items():
+        for case, stats in cases.items():
+            print(f"{stage:<9} {case:<16} median {stats['median'] * 1000:9.1f} ms"
+                  f"  (min {stats['min'] * 1000:.1f}, max {stats['max'] * 1000:.1f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench", description="seriplane benchmarks")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of " + ",".join(STAGES))
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--quick", action="store_true", help="sample-image size only, 2 repeats")
+    parser.add_argument("--out", default="bench.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    plane_sizes, strip_heights, repeat = PLANE_SIZES, STRIP_HEIGHTS, args.repeat
+    if args.quick:
+        plane_sizes, strip_heights, repeat = PLANE_SIZES[1:2], STRIP_HEIGHTS[1:2], 2
+
+    report = run(args.stages.split(","), plane_sizes, strip_heights, repeat)
+    print_report(report)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Content-hash result cache.
+
+Entries are keyed on the SHA-256 of the input image bytes plus the stage
+parameters that affect the result (crop thresholds, evenness thresholds,
+model file hash), so an image that was already analysed with the same
+settings skips crop, evenness and YOLO on the next run.
+
+Each entry is a folder holding meta.json, optional .npy arrays (loaded
+memory-mapped) and optional result files (annotated images). The folder
+size is bounded by MAX_BYTES with least-recently-used eviction; a hit
+touches the entry so it moves to the back of the queue.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# ===================== SETTINGS =====================
+CACHE_DIR = "cache"
+MAX_BYTES = 2 * 1024 ** 3          # 2 GB on disk
+# ====================================================
+
+META = "meta.json"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_key(*parts):
+    """Stable key from digests / names / parameter dicts."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._put_lock = threading.Lock()
+        self._index = None          # key -> [size_bytes, last_used]
+
+    # ---------------- public API ----------------
+    def get(self, key):
+        """
+        Returns (meta, arrays, files) for a hit, else None. arrays are
+        memory-mapped read-only; files maps stored names to their paths.
+        """
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, META)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        arrays = {
+            name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode="r")
+            for name in meta.get("_arrays", [])
+        }
+        files = {name: os.path.join(entry, name) for name in meta.get("_files", [])}
+
+        now = time.time()
+        os.utime(meta_path, (now, now))
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                index[key][1] = now
+        return meta, arrays, files
+
+    def put(self, key, meta, arrays=None, files=None):
+        """
+        Store meta (JSON-serialisable dict), arrays {name: ndarray} and
+        files {stored_name: source_path}; the files are copied.
+        """
+        arrays = arrays or {}
+        files = files or {}
+        entry = self._entry_dir(key)
+        tmp = f"{entry}.tmp{os.getpid()}_{threading.get_ident()}"
+        os.makedirs(tmp, exist_ok=True)
+
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr))
+        for name, src in files.items():
+            shutil.copyfile(src, os.path.join(tmp, name))
+
+        meta = {**meta, "_arrays": list(arrays), "_files": list(files)}
+        with open(os.path.join(tmp, META), "w") as f:
+            json.dump(meta, f)
+
+        # keys are content hashes: an entry already stored by another
+        # thread or process holds the same thing, so it is kept
+        with self._put_lock:
+            if os.path.exists(os.path.join(entry, META)):
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                shutil.rmtree(entry, ignore_errors=True)     # left over by an interrupted put
+                try:
+                    os.replace(tmp, entry)
+                except OSError:
+                    # another process got there first
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    if not os.path.exists(os.path.join(entry, META)):
+                        raise
+
+        with self._lock:
+            index = self._load_index()
+            index[key] = [self._dir_size(entry), time.time()]
+            self._evict(index)
+
+    # ---------------- internals ----------------
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    @staticmethod
+    def _dir_size(path):
+        return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+    def _load_index(self):
+        """Scan the cache folder once; afterwards the index is kept in memory."""
+        if self._index is None:
+            self._index = {}
+            if os.path.isdir(self.root):
+                for shard in os.scandir(self.root):
+                    if not shard.is_dir():
+                        continue
+                    for entry in os.scandir(shard.path):
+                        meta_path = os.path.join(entry.path, META)
+                        if entry.is_dir() and os.path.exists(meta_path):
+                            self._index[entry.name] = [
+                                self._dir_size(entry.path),
+                                os.path.getmtime(meta_path),
+                            ]
+        return self._index
+
+    def _evict(self, index):
+        total = sum(size for size, _ in index.values())
+        if total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(index.items(), key=lambda kv: kv[1][1]):
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            del index[key]
+            total -= size
+            if total <= self.max_bytes:
+                break
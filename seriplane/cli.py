@@ -0,0 +1,193 @@
+"""
+Single command line for the seriplane stages.
+
+    python cli.py run [--subprocess]        precrop -> crop -> evenness -> neatness
+    python cli.py precrop [folder] [--mode roi|lossless|rewrite] [--workers N]
+    python cli.py crop [--input DIR] [--workers N]
+    python cli.py evenness [folder] [--workers N]
+    python cli.py rescore [--since DAY] [--v1 T --v2 T --v3 T ...] [--out FILE]
+    python cli.py neatness [folder]
+    python cli.py watch [folder] [--poll S]
+    python cli.py serve [--host H] [--port P]
+    python cli.py bench [--quick] [--out FILE] [--compare OLD]
+    python cli.py sweep [folder | --from-profiles] [--v1 3,4,5 ... --min-cols 4,8]
+
+From the repository root, `python seriplane <command>` does the same.
+Paths are relative to the working directory, as with the stage scripts;
+-C DIR changes into DIR first.
+
+The stage commands (run, precrop, crop, evenness, rescore, neatness) write
+results/timings_<run id>.json with per-stage and per-image times (see
+metrics.py). --profile adds a sampling profile of the run next to it,
+--trace-memory the per-stage tracemalloc peaks.
+
+Each command imports only the stages it runs. `crop` and `evenness`
+therefore start without pandas, torch or ultralytics, and nothing is
+created on disk until a stage writes its output.
+"""
+import argparse
+import os
+import sys
+
+
+def cmd_run(args):
+    import pipeline
+    pipeline.main(["--subprocess"] if args.subprocess else [])
+
+
+def cmd_precrop(args):
+    import precrop
+    precrop.main(args.folder or precrop.INPUT_DIR, mode=args.mode, workers=args.workers)
+
+
+def cmd_crop(args):
+    import crop
+    if args.input:
+        crop.INPUT_DIR = args.input
+    crop.main(workers=args.workers)
+
+
+def cmd_evenness(args):
+    import evenness
+    evenness.main(args.folder or evenness.folder_path, workers=args.workers)
+
+
+def cmd_rescore(args):
+    import evenness
+    overrides = {
+        "v1_threshold": args.v1, "v2_threshold": args.v2, "v3_threshold": args.v3,
+        "window_size": args.window, "min_cols_for_defect": args.min_cols,
+        "column_width": args.column_width,
+        "comparators": args.comparators.split(",") if args.comparators else None,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(evenness, name, value)
+    evenness.rescore(args.since, args.until, args.images, args.out)
+
+
+def cmd_neatness(args):
+    import neatness
+    neatness.run_batch_yolo(args.folder or neatness.INPUT_DIR)
+
+
+def cmd_watch(args):
+    import watcher
+    poll_s = watcher.POLL_S if args.poll is None else args.poll
+    try:
+        watcher.run(args.folder or watcher.WATCH_DIR, poll_s=poll_s)
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+def cmd_serve(args):
+    from app import app
+    app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
+
+
+def cmd_bench(args):
+    import bench
+    return bench.main(args.tool_args)
+
+
+def cmd_sweep(args):
+    import sweep
+    return sweep.main(args.tool_args)
+
+
+# commands timed as one run by metrics.py
+TIMED_COMMANDS = {"run", "precrop", "crop", "evenness", "rescore", "neatness"}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="seriplane", description="Seriplane inspection pipeline")
+    parser.add_argument("-C", dest="workdir", metavar="DIR", help="run as if started in DIR")
+    parser.add_argument("--profile", action="store_true", help="sampling profiler during the run")
+    parser.add_argument("--trace-memory", action="store_true", help="per-stage tracemalloc peaks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="whole pipeline in one process")
+    p.add_argument("--subprocess", action="store_true", help="legacy: one interpreter per stage")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("precrop", help="crop box per raw image (recorded, or cut in place)")
+    p.add_argument("folder", nargs="?")
+    p.add_argument("--mode", choices=["roi", "lossless", "rewrite"], help="default: precrop.PRECROP_MODE")
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=cmd_precrop)
+
+    p = sub.add_parser("crop", help="cut the bright strips into ./preprocessed")
+    p.add_argument("--input", help="folder with the (pre-cropped) images")
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=cmd_crop)
+
+    p = sub.add_parser("evenness", help="brightness evenness of the strips")
+    p.add_argument("folder", nargs="?")
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=cmd_evenness)
+
+    p = sub.add_parser("rescore", help="re-run evenness thresholds on the stored column profiles")
+    p.add_argument("--since", metavar="YYYY-MM-DD")
+    p.add_argument("--until", metavar="YYYY-MM-DD")
+    p.add_argument("--images", metavar="PATTERN", help="strip names, e.g. '12_*'")
+    p.add_argument("--v1", type=float)
+    p.add_argument("--v2", type=float)
+    p.add_argument("--v3", type=float)
+    p.add_argument("--window", type=int)
+    p.add_argument("--min-cols", type=int)
+    p.add_argument("--column-width", type=int)
+    p.add_argument("--comparators", help="e.g. mean,mode,p25")
+    p.add_argument("--out", help="default: evenness.rescore_csv")
+    p.set_defaults(func=cmd_rescore)
+
+    p = sub.add_parser("neatness", help="YOLO cleanliness / neatness of the strips")
+    p.add_argument("folder", nargs="?")
+    p.set_defaults(func=cmd_neatness)
+
+    p = sub.add_parser("watch", help="process new images as they land")
+    p.add_argument("folder", nargs="?")
+    p.add_argument("--poll", type=float, default=None, help="seconds between folder scans")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("serve", help="web UI / API (app.py)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=5000)
+    p.add_argument("--debug", action="store_true")
+    p.set_defaults(func=cmd_serve)
+
+    # options are parsed by bench.main / sweep.main themselves
+    p = sub.add_parser("bench", help="benchmarks on synthetic images (see bench.py)", add_help=False)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("sweep", help="evenness threshold grid (see sweep.py)", add_help=False)
+    p.set_defaults(func=cmd_sweep)
+    return parser
+
+
+def main(argv=None, default_workdir=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command in ("bench", "sweep"):
+        args.tool_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    workdir = args.workdir or default_workdir
+    if workdir:
+        os.chdir(workdir)
+    if args.command not in TIMED_COMMANDS:
+        return args.func(args)
+
+    import metrics
+    metrics.PROFILE = metrics.PROFILE or args.profile
+    metrics.TRACE_MEMORY = metrics.TRACE_MEMORY or args.trace_memory
+    metrics.start_run()
+    try:
+        with metrics.stage(args.command):
+            return args.func(args)
+    finally:
+        path = metrics.finish_run()
+        print(f"⏱️ Timings saved: {path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
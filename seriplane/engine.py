@@ -0,0 +1,289 @@
+"""
+In-process pipeline engine.
+
+Runs precrop -> crop -> evenness -> neatness inside one Python process.
+cv2 / numpy / pandas / scipy are imported once and the YOLO weights stay
+loaded between runs, so repeated /execute calls do not pay the interpreter
+and model start-up cost of the old per-stage subprocess chain.
+
+By default the stages hand decoded NumPy arrays to each other instead of
+going through ./data and ./preprocessed: every raw image is decoded once,
+and the strips are never JPEG-encoded just to be read back by the next
+stage. Set DEBUG_DIR to also dump the strips to disk.
+
+With USE_CACHE, strips, evenness rows and YOLO rows (plus their annotated
+images) are stored in a content-hash cache, so an unchanged image with
+unchanged settings costs a hash and a few file copies on the next run.
+
+Result rows go into the run history (history.py) image by image.
+"""
+import functools
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import precrop
+import crop
+import evenness
+import neatness
+import history
+import metrics
+import render
+from batch import imap_ordered
+from cache import ResultCache, file_digest, make_key
+
+# ===================== SETTINGS =====================
+IN_MEMORY = True        # False = old file-based handoff between stages
+DEBUG_DIR = None        # e.g. "./preprocessed" to keep the strips on disk
+WORKERS = None          # threads for precrop/crop/evenness (None = all cores)
+USE_CACHE = True        # reuse results of images already analysed
+# ====================================================
+
+
+class PipelineEngine:
+    """Keeps every stage imported and warm; call run() once per batch."""
+
+    def __init__(self, warm_up=True, in_memory=IN_MEMORY, debug_dir=DEBUG_DIR,
+                 workers=WORKERS, use_cache=USE_CACHE):
+        self.in_memory = in_memory
+        self.debug_dir = debug_dir
+        self.workers = workers
+        self.cache = ResultCache() if use_cache else None
+        self.stages = [
+            ("precrop", precrop.main),
+            ("crop", crop.main),
+            ("evenness", evenness.main),
+            ("neatness", neatness.main),
+        ]
+        # one batch at a time: the stages share ./data and ./preprocessed
+        self._lock = threading.Lock()
+        if warm_up:
+            self.warm_up()
+
+    def warm_up(self):
+        """Load the YOLO weights up front instead of on the first run."""
+        neatness.load_model()
+
+    def run(self, progress=None):
+        """
+        Run every stage in order. Returns {stage: seconds}.
+
+        progress, if given, is called with keyword arguments as the run
+        advances: stage= and image= for every stage of every image, plus
+        done= and total= (images finished / images in the batch).
+        """
+        progress = progress or (lambda **event: None)
+        with self._lock:
+            metrics.start_run()
+            try:
+                if self.in_memory:
+                    return self._run_in_memory(progress)
+                return self._run_files(progress)
+            finally:
+                # results/timings_<run id>.json next to the CSVs
+                metrics.finish_run(os.path.dirname(evenness.output_csv))
+
+    def _run_files(self, progress):
+        timings = {}
+        for done, (name, stage) in enumerate(self.stages):
+            progress(stage=name, image=None, done=done, total=len(self.stages))
+            with metrics.stage(name):
+                t0 = time.perf_counter()
+                stage()
+                timings[name] = time.perf_counter() - t0
+        progress(stage="finished", image=None, done=len(self.stages), total=len(self.stages))
+        return timings
+
+    def _run_in_memory(self, progress):
+        timings = dict.fromkeys(["precrop", "crop", "evenness", "neatness"], 0.0)
+        evenness_rows = []
+        neatness_rows = []
+
+        paths = precrop.list_images()
+        total = len(paths)
+
+        # decode / crop / evenness run on worker threads (OpenCV and NumPy
+        # release the GIL); neatness stays here and feeds the model server
+        prepare = functools.partial(self.prepare_image, progress=progress)
+        prepared = imap_ordered(prepare, paths, self.workers, use_threads=True)
+        for done, (path, prep) in enumerate(zip(paths, prepared)):
+            strips, even, stage_times, strip_keys = prep
+            image = os.path.basename(path)
+            progress(stage="neatness", image=image, done=done, total=total)
+
+            t0 = time.perf_counter()
+            neat = self.run_neatness(strips, strip_keys)
+            stage_times["neatness"] = time.perf_counter() - t0
+
+            for stage, seconds in stage_times.items():
+                timings[stage] += seconds
+            metrics.record("image", sum(stage_times.values()), image)
+            metrics.count("images")
+            history.append("evenness", even)
+            history.append("neatness", neat)
+            evenness_rows.extend(even)
+            neatness_rows.extend(neat)
+            progress(stage="image_done", image=image, done=done + 1, total=total)
+
+        # same row order as the file-based stages (sorted strip names)
+        evenness_rows.sort(key=lambda r: r["Image"])
+        neatness_rows.sort(key=lambda r: r["Image_Name"])
+        evenness.write_csv(evenness_rows)
+        neatness.write_csv(neatness_rows)
+        return timings
+
+    def prepare_image(self, path, progress=None):
+        """
+        precrop -> crop -> evenness for one raw image, in memory.
+        Returns (strips, evenness_rows, {stage: seconds}, strip_keys);
+        strip_keys are the per-strip cache keys (None without a cache).
+        """
+        image = os.path.basename(path)
+        progress = progress or (lambda **event: None)
+        timings = {}
+
+        progress(stage="precrop", image=image)
+        t0 = time.perf_counter()
+        crop_key = None
+        hit = None
+        if self.cache is not None:
+            crop_key = make_key(file_digest(path), "crop",
+                                precrop.cache_params(), crop.cache_params())
+            hit = self.cache.get(crop_key)
+
+        if hit is not None:
+            meta, arrays, _ = hit
+            # the entry may have been filled by another file with the same
+            # content: the names always come from this one
+            count = meta.get("count", len(meta.get("strips", [])))
+            strips = [(name, arrays[f"strip{i}"])
+                      for i, name in enumerate(crop.strip_names(image, count))]
+            timings["precrop"] = time.perf_counter() - t0
+            t0 = time.perf_counter()
+        else:
+            with metrics.stage("precrop", image):
+                img = precrop.load_cropped(path)
+            timings["precrop"] = time.perf_counter() - t0
+            if img is None:
+                return [], [], timings, []
+
+            progress(stage="crop", image=image)
+            t0 = time.perf_counter()
+            strips = crop.crop_strips(img, image)
+            if crop_key is not None:
+                self.cache.put(
+                    crop_key,
+                    {"count": len(strips)},
+                    arrays={f"strip{i}": strip for i, (_, strip) in enumerate(strips)},
+                )
+
+        if self.debug_dir:
+            crop.save_strips(strips, self.debug_dir)
+        # plain strips for /render (one encode, no annotations); kept in
+        # results/strips, which Home does not clear
+        crop.save_strips(strips, render.STRIP_DIRS[0])
+        timings["crop"] = time.perf_counter() - t0
+
+        strip_keys = [
+            make_key(crop_key, name) if crop_key else None for name, _ in strips
+        ]
+
+        progress(stage="evenness", image=image)
+        t0 = time.perf_counter()
+        evenness_rows = [
+            row for row in (
+                self.run_evenness(name, strip, key)
+                for (name, strip), key in zip(strips, strip_keys)
+            )
+            if row is not None
+        ]
+        timings["evenness"] = time.perf_counter() - t0
+
+        return strips, evenness_rows, timings, strip_keys
+
+    def run_evenness(self, name, strip, strip_key=None):
+        """evenness.analyse_image for one strip, through the cache."""
+        if strip_key is None:
+            return evenness.analyse_image(strip, name)
+
+        key = make_key(strip_key, "evenness", evenness.cache_params())
+        hit = self.cache.get(key)
+        if hit is not None:
+            meta, _, files = hit
+            if meta["row"] is not None:
+                # profile + region record for this run; only the render is skipped
+                evenness.record_strip(strip, name)
+            restore_files(files, evenness.annotated_paths(name))
+            return meta["row"]
+
+        row = evenness.analyse_image(strip, name)
+        outputs = evenness.annotated_paths(name) if row is not None else []
+        self.cache.put(key, {"row": row},
+                       files={os.path.basename(p): p for p in outputs})
+        return row
+
+    def run_neatness(self, strips, strip_keys=None):
+        """neatness.run_batch_arrays, skipping strips already in the cache."""
+        if not strips:
+            return []
+        if self.cache is None or not strip_keys or strip_keys[0] is None:
+            return neatness.run_batch_arrays(strips)
+
+        params = neatness.cache_params()
+        keys = [make_key(k, "neatness", params) for k in strip_keys]
+        rows = [None] * len(strips)
+        misses = []
+
+        for i, ((name, _), key) in enumerate(zip(strips, keys)):
+            hit = self.cache.get(key)
+            if hit is None:
+                misses.append(i)
+                continue
+            meta, _, files = hit
+            rows[i] = {**meta["row"], "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            if files:
+                output_path = os.path.join(neatness.OUTPUT_DIR, name)
+                restore_files(files, [output_path])
+                rows[i]["Output_Image_Path"] = output_path
+
+        if misses:
+            fresh = neatness.run_batch_arrays([strips[i] for i in misses])
+            for i, row in zip(misses, fresh):
+                rows[i] = row
+                output_path = row["Output_Image_Path"]
+                files = {strips[i][0]: output_path} if os.path.isfile(output_path) else {}
+                self.cache.put(keys[i], {"row": row}, files=files)
+        return rows
+
+    def process_image(self, path):
+        """
+        Push one raw image through every stage in memory.
+        Returns (evenness_rows, neatness_rows) for its strips.
+        """
+        strips, evenness_rows, _, strip_keys = self.prepare_image(path)
+        return evenness_rows, self.run_neatness(strips, strip_keys)
+
+
+def restore_files(files, dst_paths):
+    """Copy cached result files back to where the stage would have written them."""
+    by_name = {os.path.basename(p): p for p in dst_paths}
+    for name, src in files.items():
+        dst = by_name.get(name)
+        if dst is not None:
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            shutil.copyfile(src, dst)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Process-wide engine, created (and warmed up) on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = PipelineEngine()
+    return _engine
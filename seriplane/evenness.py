@@ -1,9 +1,14 @@
 import os
 import glob
+import json
 import cv2
 import numpy as np
-import pandas as pd
-from scipy import stats
+
+import history
+import metrics
+import profiles
+import results_store
+from batch import imap_ordered
 
 # ============================
 # USER CONFIG
@@ -20,8 +25,26 @@ v2_threshold = 8
 v3_threshold = 11
 min_cols_for_defect = 8
 
-# create output dir
-os.makedirs(output_image_dir, exist_ok=True)
+# global brightness references the local means are compared against:
+# "mean", "mode", "median" or a percentile such as "p25"
+comparators = ["mean", "mode"]
+
+# annotated output per strip:
+#   "separate"  - one full-size JPEG per comparator (<name>_MEAN.jpg, ...)
+#   "overlay"   - every comparator drawn onto one shared full-size JPEG
+#   "thumbnail" - the overlay at thumbnail_width px wide
+#   "json"      - region lists only (<name>_regions.json), no image
+#   "none"      - nothing; draw on demand from the results store (/render)
+render_mode = "separate"
+thumbnail_width = 275
+
+# parallel images (None = all cores)
+num_workers = None
+
+# keep each strip's column sums + histogram in results/profiles, so
+# `cli.py rescore` can re-run the thresholds without decoding (profiles.py)
+store_profiles = True
+rescore_csv = "results/evenness_rescored.csv"
 
 # colors for drawing (BGR)
 colors = {
@@ -32,6 +55,63 @@ colors = {
 priority = {'v1': 1, 'v2': 2, 'v3': 3}
 
 
+def cache_params():
+    """Settings that change the evenness result (used in result-cache keys)."""
+    return {
+        "column_width": column_width,
+        "window_size": window_size,
+        "v1_threshold": v1_threshold,
+        "v2_threshold": v2_threshold,
+        "v3_threshold": v3_threshold,
+        "min_cols_for_defect": min_cols_for_defect,
+        "comparators": list(comparators),
+        "render_mode": render_mode,
+        "thumbnail_width": thumbnail_width,
+    }
+
+
+def annotated_paths(img_name):
+    """Paths of the files analyse_image writes for img_name in render_mode."""
+    stem = os.path.splitext(img_name)[0]
+    if render_mode == "separate":
+        names = [f"{stem}_{c.upper()}.jpg" for c in comparators]
+    elif render_mode == "overlay":
+        names = [f"{stem}_OVERLAY.jpg"]
+    elif render_mode == "thumbnail":
+        names = [f"{stem}_THUMB.jpg"]
+    elif render_mode == "json":
+        names = [f"{stem}_regions.json"]
+    elif render_mode == "none":
+        names = []
+    else:
+        raise ValueError(f"Unknown render_mode: {render_mode}")
+    return [os.path.join(output_image_dir, n) for n in names]
+
+
+def comparator_label(name):
+    """CSV column prefix for a comparator: mean -> Mean, p25 -> P25."""
+    return name.capitalize()
+
+
+def comparator_percentile(name):
+    """Percentile a comparator needs from brightness_stats, or None."""
+    if name == "median":
+        return 50.0
+    if name.startswith("p"):
+        return float(name[1:])
+    return None
+
+
+def comparator_value(name, brightness):
+    """Look up a comparator's reference brightness in brightness_stats output."""
+    if name in ("mean", "mode"):
+        return brightness[name]
+    q = comparator_percentile(name)
+    if q is None:
+        raise ValueError(f"Unknown comparator: {name}")
+    return brightness[f"p{q:g}"]
+
+
 def classify(dev):
     """Classify by deviation percentage into v1 / v2 / v3."""
     abs_dev = abs(dev)
@@ -45,105 +125,217 @@ def classify(dev):
         return None
 
 
+# class codes used by the vectorized core: 0 = no defect, 1..3 = v1..v3
+CLASS_NAMES = np.array([None, 'v1', 'v2', 'v3'], dtype=object)
+
+
+def classify_columns(deviation_percent):
+    """Vectorized classify(): int code per column (0 = None, 1/2/3 = v1/v2/v3)."""
+    abs_dev = np.abs(deviation_percent)
+    return np.select(
+        [abs_dev >= v3_threshold, abs_dev >= v2_threshold, abs_dev >= v1_threshold],
+        [3, 2, 1],
+        default=0,
+    )
+
+
+def run_lengths(codes):
+    """Run-length encode codes -> (starts, ends, values), ends inclusive."""
+    n = len(codes)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    change = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change - 1, [n - 1]))
+    return starts, ends, codes[starts]
+
+
+def merge_close_regions(starts, ends, cls, min_cols):
+    """
+    Merge consecutive regions whose gap is < min_cols. Inside a merged
+    group the class switches to region j's class whenever region j is wider
+    than everything merged so far (the same rule as the old greedy loop).
+    """
+    if len(starts) == 0:
+        return starts, ends, cls
+
+    gaps = starts[1:] - ends[:-1] - 1
+    new_group = np.concatenate(([True], gaps >= min_cols))
+    group_id = np.cumsum(new_group) - 1
+    first_idx = np.flatnonzero(new_group)
+    last_idx = np.concatenate((first_idx[1:] - 1, [len(starts) - 1]))
+
+    # width of the merged box just before region j is added
+    group_start = starts[first_idx][group_id]
+    merged_width = np.concatenate(([0], ends[:-1])) - group_start + 1
+    widths = ends - starts + 1
+    takes_over = new_group | (widths > merged_width)
+
+    # last region in each group whose class won
+    winner = np.maximum.accumulate(np.where(takes_over, np.arange(len(starts)), 0))
+
+    return starts[first_idx], ends[last_idx], cls[winner[last_idx]]
+
+
+def regions_from_codes(codes, min_cols):
+    """
+    Class codes per column -> (merged_regions, class_counts): runs of the
+    same class become regions, regions shorter than min_cols are dropped and
+    regions separated by fewer than min_cols columns are merged.
+    """
+    starts, ends, cls = run_lengths(codes)
+
+    # keep defect regions with length >= min_cols. Runs never overlap, so
+    # the priority pass and the rebuild of the old loop leave them unchanged.
+    keep = (cls > 0) & ((ends - starts + 1) >= min_cols)
+    starts, ends, cls = starts[keep], ends[keep], cls[keep]
+
+    # merge nearby boxes if gap < min_cols, keep wider class
+    starts, ends, cls = merge_close_regions(starts, ends, cls, min_cols)
+
+    merged_regions = list(zip(starts.tolist(), ends.tolist(), CLASS_NAMES[cls].tolist()))
+
+    # count classes
+    counts = np.bincount(cls, minlength=4)
+    class_counts = {'v1': int(counts[1]), 'v2': int(counts[2]), 'v3': int(counts[3])}
+
+    return merged_regions, class_counts
+
+
 def compute_regions_from_comparator(local_means, comparator_value, num_cols, min_cols):
     """
     Given local_means and a comparator (global mean or mode),
     compute final merged regions + class counts, following your logic.
-    Returns (final_regions, class_counts).
+    Returns (final_regions, class_counts, deviation_percent).
     """
     eps = 1e-8
     deviation_percent = ((local_means - comparator_value) / (comparator_value + eps)) * 100
 
-    # classify columns
-    column_classes = [classify(dev) for dev in deviation_percent]
-
-    # merge adjacent same-class into regions
-    regions = []
-    start = None
-    current_class = None
-    for i in range(num_cols):
-        c = column_classes[i]
-        if c != current_class:
-            if current_class is not None:
-                regions.append((start, i - 1, current_class))
-            start = i if c is not None else None
-            current_class = c
-    if current_class is not None:
-        regions.append((start, num_cols - 1, current_class))
-
-    # keep regions with length >= min_cols
-    filtered_regions = [
-        (start, end, cls)
-        for start, end, cls in regions
-        if (end - start + 1) >= min_cols
-    ]
-
-    # overlap resolution by priority
-    final_classes = [None] * num_cols
-    for start, end, cls in filtered_regions:
-        for i in range(start, end + 1):
-            if final_classes[i] is None or priority[cls] > priority.get(final_classes[i], 0):
-                final_classes[i] = cls
-
-    # rebuild regions from final_classes
-    final_regions = []
-    start = None
-    current_class = None
-    for i in range(num_cols):
-        c = final_classes[i]
-        if c != current_class:
-            if current_class is not None:
-                final_regions.append((start, i - 1, current_class))
-            start = i if c is not None else None
-            current_class = c
-    if current_class is not None:
-        final_regions.append((start, num_cols - 1, current_class))
+    # classify columns, then merge adjacent same-class columns into regions
+    codes = classify_columns(deviation_percent[:num_cols])
+    merged_regions, class_counts = regions_from_codes(codes, min_cols)
 
-    # merge nearby boxes if gap < min_cols, keep wider class
-    merged_regions = []
-    i = 0
-    while i < len(final_regions):
-        start1, end1, cls1 = final_regions[i]
-        width1 = end1 - start1 + 1
-
-        j = i + 1
-        while j < len(final_regions):
-            start2, end2, cls2 = final_regions[j]
-            width2 = end2 - start2 + 1
-            gap = start2 - end1 - 1
-
-            if gap < min_cols:
-                # choose class with larger width
-                chosen_class = cls1 if width1 >= width2 else cls2
-                end1 = end2
-                cls1 = chosen_class
-                width1 = end1 - start1 + 1
-                j += 1
-            else:
-                break
-
-        merged_regions.append((start1, end1, cls1))
-        i = j
+    return merged_regions, class_counts, deviation_percent
 
-    # count classes
-    class_counts = {'v1': 0, 'v2': 0, 'v3': 0}
-    for _, _, cls in merged_regions:
-        if cls is not None:
-            class_counts[cls] += 1
 
-    return merged_regions, class_counts, deviation_percent
+def compute_regions_multi(local_means, comparator_values, num_cols, min_cols):
+    """
+    compute_regions_from_comparator for several comparators at once:
+    deviations and classes for all of them come from one 2-D pass over
+    local_means. comparator_values is {name: value}; returns
+    {name: (final_regions, class_counts, deviation_percent)}.
+    """
+    eps = 1e-8
+    names = list(comparator_values)
+    refs = np.array([comparator_values[n] for n in names], dtype=np.float64)[:, None]
+
+    deviation_percent = ((local_means[None, :] - refs) / (refs + eps)) * 100
+    codes = classify_columns(deviation_percent[:, :num_cols])
+
+    return {
+        name: (*regions_from_codes(codes[i], min_cols), deviation_percent[i])
+        for i, name in enumerate(names)
+    }
+
+
+def column_profile(gray, col_width=None):
+    """Mean brightness of each column_width-wide block of a grayscale image."""
+    # exact integer sums, so the means match np.mean(block) bit for bit
+    return block_means(gray.sum(axis=0, dtype=np.int64), gray.shape[0], col_width)
+
+
+def block_means(col_sums, height, col_width=None):
+    """column_profile from the per-pixel-column sums of a strip `height` rows tall."""
+    col_width = column_width if col_width is None else col_width
+    num_cols = len(col_sums) // col_width
+    block_sums = np.asarray(col_sums[:num_cols * col_width]).reshape(num_cols, col_width).sum(axis=1)
+    return block_sums / (height * col_width)
+
+
+def brightness_stats(gray, percentiles=()):
+    """
+    Mean, mode and optional percentiles of a uint8 grayscale image, all read
+    off one 256-bin histogram (no flattened copy, no sort).
+
+    Returns {"mean": ..., "mode": ..., "p<q>": ...}. The values match
+    np.mean, scipy.stats.mode (smallest most common value) and
+    np.percentile with linear interpolation.
+    """
+    return histogram_stats(gray_histogram(gray), percentiles)
+
+
+def gray_histogram(gray):
+    """256-bin histogram of a uint8 grayscale image (int64 counts)."""
+    return cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+
+
+def histogram_stats(hist, percentiles=()):
+    """brightness_stats from a 256-bin histogram."""
+    hist = np.asarray(hist, dtype=np.int64)
+    n = int(hist.sum())
+    if n == 0:
+        return {"mean": float("nan"), "mode": 0.0,
+                **{f"p{q:g}": float("nan") for q in percentiles}}
+
+    levels = np.arange(256, dtype=np.int64)
+    out = {
+        "mean": float(np.dot(hist, levels)) / n,
+        "mode": float(np.argmax(hist)),
+    }
+
+    cdf = np.cumsum(hist)
+    for q in percentiles:
+        pos = q / 100 * (n - 1)
+        lo = int(np.floor(pos))
+        hi = min(lo + 1, n - 1)
+        # value at sorted index k = first level whose cdf exceeds k
+        v_lo = float(np.searchsorted(cdf, lo, side="right"))
+        v_hi = float(np.searchsorted(cdf, hi, side="right"))
+        out[f"p{q:g}"] = v_lo + (v_hi - v_lo) * (pos - lo)
+    return out
+
+
+def sliding_mean(values, size=None):
+    """
+    Centered moving average over `size` entries, truncated at both ends.
+    Interior windows are reduced in one strided pass; only the few edge
+    windows are averaged one by one.
+    """
+    size = window_size if size is None else size
+    n = len(values)
+    half_w = size // 2
+    out = np.empty(n, dtype=np.float64)
+
+    full = 2 * half_w + 1
+    if n >= full:
+        windows = np.lib.stride_tricks.sliding_window_view(values, full)
+        out[half_w:n - half_w] = windows.mean(axis=-1)
+        edges = list(range(half_w)) + list(range(n - half_w, n))
+    else:
+        edges = range(n)
+
+    for i in edges:
+        s = max(0, i - half_w)
+        e = min(n, i + half_w + 1)
+        out[i] = np.mean(values[s:e])
+    return out
 
 
 def process_image(img_path):
     """Run the full pipeline on a single image and return summary + save images."""
-    img_name = os.path.basename(img_path)
-    img = cv2.imread(img_path)
+    with metrics.stage("evenness.decode", os.path.basename(img_path)):
+        img = cv2.imread(img_path)
     if img is None:
         print(f"Could not read {img_path}, skipping.")
         return None
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    h, w = gray.shape
+    return analyse_image(img, os.path.basename(img_path))
+
+
+def analyse_image(img, img_name):
+    """Same as process_image, for an already decoded BGR strip."""
+    w = img.shape[1]
 
     # column means
     num_cols = w // column_width
@@ -151,118 +343,234 @@ def process_image(img_path):
         print(f"Image {img_name}: column_width too large, skipping.")
         return None
 
-    column_means = []
-    for i in range(num_cols):
-        start = i * column_width
-        end = min((i + 1) * column_width, w)
-        block = gray[:, start:end]
-        column_means.append(np.mean(block))
-    column_means = np.array(column_means)
+    values, results = record_strip(img, img_name)
+
+    with metrics.stage("evenness.render", img_name):
+        render_annotations(img, img_name, results, values)
+
+    summary = summary_row(img_name, values, results)
+    print(f"Processed {img_name}: " + ", ".join(
+        f"{c.upper()} defects={summary[f'{comparator_label(c)}_Total_Defects']}"
+        for c in comparators
+    ))
+    return summary
+
+
+def record_strip(img, img_name):
+    """
+    Profile and regions of one BGR strip, kept in the profile store and
+    results_store. Returns ({comparator: value}, compute_regions_multi
+    results). Also called for strips whose row comes from the cache.
+    """
+    with metrics.stage("evenness.stats", img_name):
+        _, hist, col_sums = strip_profile(img)
+        if store_profiles:
+            profiles.save(img_name, img.shape[0], hist, col_sums)
+
+    # ===== ALL COMPARATORS IN ONE PASS =====
+    with metrics.stage("evenness.regions", img_name):
+        values, results = analyse_profile(col_sums, img.shape[0], hist)
+        results_store.append(region_record(img_name, img.shape, results, values))
+    return values, results
+
+
+def strip_profile(img):
+    """
+    (height, 256-bin histogram, per-pixel-column sums) of a BGR strip, from
+    cvtColor's grayscale. Everything scoring strips (rescore, sweep) starts
+    from this, so the counts match a normal evenness run exactly.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return gray.shape[0], gray_histogram(gray), gray.sum(axis=0, dtype=np.int64)
+
+
+def analyse_profile(col_sums, height, hist):
+    """
+    Thresholding for one strip from its column sums and histogram:
+    returns ({comparator: value}, compute_regions_multi results).
+    """
+    num_cols = len(col_sums) // column_width
+    column_means = block_means(col_sums, height)
 
-    # global mean & mode
-    mean_brightness = float(np.mean(gray))
-    mode_res = stats.mode(gray.flatten(), keepdims=True)
-    mode_brightness = float(mode_res.mode[0]) if mode_res.count.size > 0 else 0.0
+    # global references (mean, mode, percentiles) from one histogram
+    percentiles = [q for q in map(comparator_percentile, comparators) if q is not None]
+    brightness = histogram_stats(hist, percentiles)
+    values = {c: comparator_value(c, brightness) for c in comparators}
 
     # local means
-    half_w = window_size // 2
-    local_means = []
-    for i in range(num_cols):
-        s = max(0, i - half_w)
-        e = min(num_cols, i + half_w + 1)
-        local_means.append(np.mean(column_means[s:e]))
-    local_means = np.array(local_means)
+    local_means = sliding_mean(column_means)
+    return values, compute_regions_multi(local_means, values, num_cols, min_cols_for_defect)
+
+
+def summary_row(img_name, values, results):
+    """CSV row for one strip."""
+    summary = {"Image": img_name}
+    for c in comparators:
+        summary[f"{comparator_label(c)}_Brightness"] = values[c]
+    for c in comparators:
+        class_counts = results[c][1]
+        label = comparator_label(c)
+        summary[f"{label}_v1_Count"] = class_counts['v1']
+        summary[f"{label}_v2_Count"] = class_counts['v2']
+        summary[f"{label}_v3_Count"] = class_counts['v3']
+        summary[f"{label}_Total_Defects"] = sum(class_counts.values())
+    return summary
 
-    # ===== MEAN COMPARATOR =====
-    final_regions_mean, class_counts_mean, dev_mean = compute_regions_from_comparator(
-        local_means, mean_brightness, num_cols, min_cols_for_defect
-    )
 
-    # draw boxes for MEAN comparator
-    output_img_mean = img.copy()
-    for start, end, cls in final_regions_mean:
-        if cls is None:
-            continue
-        color = colors[cls]
-        x1 = start * column_width
-        x2 = min((end + 1) * column_width, w - 1)
-        cv2.rectangle(output_img_mean, (x1, 0), (x2, h - 1), color, 15)
-        cv2.putText(output_img_mean, cls.upper(), (x1 + 5, 25),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-    # save MEAN image
-    mean_out_path = os.path.join(
-        output_image_dir,
-        f"{os.path.splitext(img_name)[0]}_MEAN.jpg"
-    )
-    cv2.imwrite(mean_out_path, output_img_mean)
+# ============================
+# RENDERING
+# ============================
+def region_record(img_name, shape, results, values):
+    """Results-store record for one strip: regions, counts and deviations."""
+    h, w = shape[:2]
+    return {
+        "stage": "evenness",
+        "image": img_name,
+        "width": w,
+        "height": h,
+        "column_width": column_width,
+        "comparators": {
+            c: {
+                "value": values[c],
+                "regions": results[c][0],
+                "counts": results[c][1],
+                "deviation": np.round(results[c][2], 3).tolist(),
+            }
+            for c in comparators
+        },
+    }
 
-    # ===== MODE COMPARATOR =====
-    final_regions_mode, class_counts_mode, dev_mode = compute_regions_from_comparator(
-        local_means, mode_brightness, num_cols, min_cols_for_defect
-    )
 
-    # draw boxes for MODE comparator
-    output_img_mode = img.copy()
-    for start, end, cls in final_regions_mode:
+def draw_regions(canvas, regions, scale=1.0, label_prefix="", label_scale=0.7,
+                 inset=0, label_row=0, col_width=None):
+    """Draw one comparator's regions onto canvas (coordinates scaled by scale)."""
+    col_width = column_width if col_width is None else col_width
+    h, w = canvas.shape[:2]
+    thickness = max(1, int(round(15 * scale)))
+    for start, end, cls in regions:
         if cls is None:
             continue
         color = colors[cls]
-        x1 = start * column_width
-        x2 = min((end + 1) * column_width, w - 1)
-        cv2.rectangle(output_img_mode, (x1, 0), (x2, h - 1), color, 15)
-        cv2.putText(output_img_mode, cls.upper(), (x1 + 5, 25),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-
-    # save MODE image
-    mode_out_path = os.path.join(
-        output_image_dir,
-        f"{os.path.splitext(img_name)[0]}_MODE.jpg"
-    )
-    cv2.imwrite(mode_out_path, output_img_mode)
-
-    # build summary row
-    summary = {
-        "Image": img_name,
-        "Mean_Brightness": mean_brightness,
-        "Mode_Brightness": mode_brightness,
-        "Mean_v1_Count": class_counts_mean['v1'],
-        "Mean_v2_Count": class_counts_mean['v2'],
-        "Mean_v3_Count": class_counts_mean['v3'],
-        "Mean_Total_Defects": sum(class_counts_mean.values()),
-        "Mode_v1_Count": class_counts_mode['v1'],
-        "Mode_v2_Count": class_counts_mode['v2'],
-        "Mode_v3_Count": class_counts_mode['v3'],
-        "Mode_Total_Defects": sum(class_counts_mode.values()),
-    }
-
-    print(f"Processed {img_name}: MEAN defects={summary['Mean_Total_Defects']}, "
-          f"MODE defects={summary['Mode_Total_Defects']}")
-    return summary
+        x1 = int(start * col_width * scale)
+        x2 = min(int((end + 1) * col_width * scale), w - 1)
+        cv2.rectangle(canvas, (x1 + inset, inset), (x2 - inset, h - 1 - inset), color, thickness)
+        cv2.putText(canvas, label_prefix + cls.upper(),
+                    (x1 + 5 + inset, int(25 * max(scale, 0.5)) + 25 * label_row),
+                    cv2.FONT_HERSHEY_SIMPLEX, label_scale * max(scale, 0.5), color, 2)
+
+
+def render_annotations(img, img_name, results, values):
+    """Write the annotated output(s) for one strip according to render_mode."""
+    out_paths = annotated_paths(img_name)
+    if out_paths:
+        os.makedirs(output_image_dir, exist_ok=True)
+
+    if render_mode == "separate":
+        # one scratch buffer reused for every comparator
+        canvas = np.empty_like(img)
+        for c, out_path in zip(comparators, out_paths):
+            np.copyto(canvas, img)
+            draw_regions(canvas, results[c][0], label_scale=0.6 if c == "mean" else 0.7)
+            cv2.imwrite(out_path, canvas)
+
+    elif render_mode in ("overlay", "thumbnail"):
+        if render_mode == "thumbnail":
+            scale = thumbnail_width / img.shape[1]
+            canvas = cv2.resize(img, (thumbnail_width, max(1, int(img.shape[0] * scale))),
+                                interpolation=cv2.INTER_AREA)
+        else:
+            scale = 1.0
+            canvas = img.copy()
+        thickness = max(1, int(round(15 * scale)))
+        for i, c in enumerate(comparators):
+            draw_regions(canvas, results[c][0], scale=scale,
+                         label_prefix=f"{c.upper()} ", inset=i * thickness, label_row=i)
+        cv2.imwrite(out_paths[0], canvas)
+
+    elif render_mode == "json":
+        h, w = img.shape[:2]
+        payload = {
+            "image": img_name,
+            "width": w,
+            "height": h,
+            "column_width": column_width,
+            "comparators": {
+                c: {"value": values[c], "regions": results[c][0], "counts": results[c][1]}
+                for c in comparators
+            },
+        }
+        with open(out_paths[0], "w") as f:
+            json.dump(payload, f)
 
 
 # ============================
 # MAIN LOOP OVER IMAGES
 # ============================
-image_paths = sorted(
-    p for p in glob.glob(os.path.join(folder_path, "*"))
-    if p.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))
-)
-
-if not image_paths:
-    raise RuntimeError(f"No image files found in {folder_path}")
-
-# process at most 10 images
-image_paths = image_paths[:10]
-
-rows = []
-for path in image_paths:
-    row = process_image(path)
-    if row is not None:
-        rows.append(row)
-
-# save CSV
-df = pd.DataFrame(rows)
-df.to_csv(output_csv, index=False)
-print(f"\nSaved defect summary for {len(rows)} image(s) to {output_csv}")
-print(f"Annotated images saved to: {output_image_dir}")
\ No newline at end of file
+def list_images(folder=folder_path):
+    """Sorted list of image files inside folder."""
+    return sorted(
+        p for p in glob.glob(os.path.join(folder, "*"))
+        if p.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))
+    )
+
+
+def write_csv(rows, csv_path=output_csv):
+    """Save the per-image summary rows as the evenness CSV."""
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+    df = pd.DataFrame(rows)
+    df.to_csv(csv_path, index=False)
+    print(f"\nSaved defect summary for {len(rows)} image(s) to {csv_path}")
+    print(f"Annotated images saved to: {output_image_dir}")
+
+
+def main(folder=folder_path, workers=None):
+    workers = num_workers if workers is None else workers
+    image_paths = list_images(folder)
+
+    if not image_paths:
+        raise RuntimeError(f"No image files found in {folder}")
+
+    # rows come back in sorted file order whatever the worker count;
+    # each one goes into the run history as soon as it is back
+    rows = []
+    for row in imap_ordered(process_image, image_paths, workers):
+        if row is not None:
+            history.append("evenness", [row])
+            rows.append(row)
+
+    # save CSV
+    write_csv(rows)
+    return rows
+
+
+def rescore(since=None, until=None, pattern=None, csv_path=None):
+    """
+    Re-run the thresholds over the stored profiles (no image decode, no
+    rendering) with the current settings; writes and returns the rows,
+    each tagged with the day the strip was analysed.
+    """
+    csv_path = csv_path or rescore_csv
+    rows = []
+    for day, image, path in profiles.iter_profiles(since, until, pattern):
+        height, hist, col_sums = profiles.load(path)
+        if len(col_sums) // column_width <= 0:
+            continue
+        values, results = analyse_profile(col_sums, height, hist)
+        rows.append({"Date": day, **summary_row(image, values, results)})
+
+    if not rows:
+        print(f"No stored profiles in {profiles.PROFILE_DIR}")
+        return rows
+
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+    print(f"Re-scored {len(rows)} strip(s) into {csv_path}")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Run history of the evenness and neatness results.
+
+Every result row goes into one SQLite database (results/history.db, WAL
+mode) as soon as its image is finished. Each row is tagged with the run
+it belongs to (the metrics.py run id when one is open), so earlier runs
+stay queryable after the CSVs are rewritten by the next one.
+
+Tables:
+    evenness, neatness   one row per strip, the CSV columns plus
+                         _run / _time / _image (indexed)
+    defects              (stage, class, count) per row with count > 0,
+                         indexed by class and time
+    runs                 run id, first / last write, rows per stage
+    edits                cells changed by hand in the web UI
+
+Defect classes are "<Comparator>_v1".."_v3" for evenness (Mean_v3,
+Mode_v1, ...) and the YOLO class names for neatness (minor, major, ...).
+
+app.py streams /csv/<stage> from here (latest run, or filtered by run,
+date, image or defect class) instead of reading the CSV files.
+"""
+import contextlib
+import csv
+import io
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+# ===================== SETTINGS =====================
+HISTORY_DB = os.path.join("results", "history.db")
+CSV_CHUNK_ROWS = 500            # rows per streamed /csv chunk
+# ====================================================
+
+STAGES = ("evenness", "neatness")
+IMAGE_COLUMN = {"evenness": "Image", "neatness": "Image_Name"}
+META_COLUMNS = ("_run", "_time", "_image")
+
+_process_run = None
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def defect_classes(stage, row):
+    """{class: count} of a result row."""
+    if stage == "evenness":
+        return {k[:-len("_Count")]: v for k, v in row.items() if k.endswith("_Count")}
+    return {k.split("_", 1)[1]: v for k, v in row.items()
+            if k.startswith(("Cleanliness_", "Neatness_"))}
+
+
+def _number(value):
+    """Edited cell text as int / float where it is one."""
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def current_run_id():
+    """The open metrics run, else one id for the rest of the process."""
+    global _process_run
+    import metrics
+
+    run_id = metrics.current_run_id()
+    if run_id is None:
+        _process_run = _process_run or metrics.new_run_id()
+        run_id = _process_run
+    return run_id
+
+
+def _until(day):
+    """Exclusive upper bound for an inclusive YYYY-MM-DD[ HH:MM:SS] `until`."""
+    if len(day) == 10:
+        return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    return day + "\x01"
+
+
+class RunHistory:
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._columns = {}          # stage -> CSV columns in first-seen order
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for stage in STAGES:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {stage} "
+                             "(id INTEGER PRIMARY KEY AUTOINCREMENT, _run TEXT, _time TEXT, _image TEXT)")
+                for col in META_COLUMNS:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {stage}{col} ON {stage} ({col})")
+                self._refresh_columns(conn, stage)
+            conn.execute("CREATE TABLE IF NOT EXISTS defects "
+                         "(row_id INTEGER, stage TEXT, class TEXT, count INTEGER, _time TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS defects_class ON defects (stage, class, _time)")
+            conn.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started TEXT, "
+                         "finished TEXT, evenness_rows INTEGER DEFAULT 0, neatness_rows INTEGER DEFAULT 0)")
+            conn.execute("CREATE TABLE IF NOT EXISTS edits (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "stage TEXT, row_id INTEGER, column TEXT, old, new, time TEXT)")
+
+    # ---------------- write ----------------
+    def append(self, stage, rows, run_id=None):
+        """Store the rows of one finished image (one transaction)."""
+        rows = [r for r in rows if r is not None]
+        if not rows:
+            return
+        run_id = run_id or current_run_id()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        image_col = IMAGE_COLUMN[stage]
+
+        with self._lock, self._connection() as conn:
+            self._add_columns(conn, stage, rows)
+            cols = self._columns[stage]
+            sql = (f"INSERT INTO {stage} (_run, _time, _image, {', '.join(_quote(c) for c in cols)}) "
+                   f"VALUES (?, ?, ?, {', '.join('?' * len(cols))})")
+            for row in rows:
+                cur = conn.execute(sql, (run_id, now, row.get(image_col), *(row.get(c) for c in cols)))
+                conn.executemany(
+                    "INSERT INTO defects VALUES (?, ?, ?, ?, ?)",
+                    [(cur.lastrowid, stage, cls, n, now)
+                     for cls, n in defect_classes(stage, row).items() if n]
+                )
+            conn.execute("INSERT INTO runs (run_id, started, finished) VALUES (?, ?, ?) "
+                         "ON CONFLICT(run_id) DO UPDATE SET finished = excluded.finished",
+                         (run_id, now, now))
+            conn.execute(f"UPDATE runs SET {stage}_rows = {stage}_rows + ? WHERE run_id = ?",
+                         (len(rows), run_id))
+
+    def apply_edits(self, stage, edits, run_id=None):
+        """
+        Cells changed by hand, as [{"image", "column", "value"}], applied
+        to the rows of run_id (default: the latest run) and kept in edits.
+        Returns the number of cells changed.
+        """
+        run_id = run_id or self.latest_run(stage)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        changed = 0
+        with self._lock, self._connection() as conn:
+            self._refresh_columns(conn, stage)
+            for edit in edits:
+                column = edit.get("column")
+                if column not in self._columns[stage]:
+                    continue
+                value = _number(edit.get("value"))
+                for row_id, old, row_time in conn.execute(
+                        f"SELECT id, {_quote(column)}, _time FROM {stage} WHERE _run = ? AND _image = ?",
+                        (run_id, edit.get("image"))).fetchall():
+                    if old == value:
+                        continue
+                    conn.execute(f"UPDATE {stage} SET {_quote(column)} = ? WHERE id = ?", (value, row_id))
+                    conn.execute("INSERT INTO edits (stage, row_id, column, old, new, time) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", (stage, row_id, column, old, value, now))
+
+                    # keep the defect index in step with a corrected count
+                    for cls, n in defect_classes(stage, {column: value}).items():
+                        conn.execute("DELETE FROM defects WHERE row_id = ? AND stage = ? AND class = ?",
+                                     (row_id, stage, cls))
+                        if isinstance(n, (int, float)) and n > 0:
+                            conn.execute("INSERT INTO defects VALUES (?, ?, ?, ?, ?)",
+                                         (row_id, stage, cls, n, row_time))
+                    changed += 1
+        return changed
+
+    # ---------------- read ----------------
+    def latest_run(self, stage):
+        """Run id of the most recent row of stage, or None."""
+        with self._connection() as conn:
+            row = conn.execute(f"SELECT _run FROM {stage} ORDER BY id DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def runs(self, limit=50):
+        """Most recent runs first."""
+        with self._connection() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM runs ORDER BY finished DESC, rowid DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self, stage, **filters):
+        where, params = self._where(stage, **filters)
+        with self._connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {stage}{where}", params).fetchone()[0]
+
+    def query(self, stage, run=None, since=None, until=None, image=None, defect=None):
+        """Rows as dicts (CSV columns plus _run / _time), in insert order."""
+        where, params = self._where(stage, run, since, until, image, defect)
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [
+                {k: r[k] for k in r.keys() if k != "id" and (k in ("_run", "_time") or r[k] is not None)}
+                for r in conn.execute(f"SELECT * FROM {stage}{where} ORDER BY id", params)
+            ]
+        finally:
+            conn.close()
+
+    def iter_csv(self, stage, run=None, since=None, until=None, image=None, defect=None):
+        """
+        The selected rows as CSV text, yielded in chunks of CSV_CHUNK_ROWS.
+        Only columns holding a value in the selection are included.
+        """
+        where, params = self._where(stage, run, since, until, image, defect)
+        conn = self._connect()
+        try:
+            # columns other processes may have added
+            self._refresh_columns(conn, stage)
+            cols = self._columns[stage]
+            if not cols:
+                return
+            used = conn.execute(
+                f"SELECT {', '.join(f'COUNT({_quote(c)})' for c in cols)} FROM {stage}{where}", params
+            ).fetchone()
+            cols = [c for c, n in zip(cols, used) if n]
+
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            writer.writerow(cols)
+            cursor = conn.execute(
+                f"SELECT {', '.join(_quote(c) for c in cols)} FROM {stage}{where} ORDER BY id", params)
+            while True:
+                chunk = cursor.fetchmany(CSV_CHUNK_ROWS)
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            if buf.tell():
+                yield buf.getvalue()
+        finally:
+            conn.close()
+
+    # ---------------- internals ----------------
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """One transaction (commit, or rollback on error); the connection is closed after."""
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _add_columns(self, conn, stage, rows):
+        missing = [name for row in rows for name in row if name not in self._columns[stage]]
+        if not missing:
+            return
+        # another process (cli evenness, cli watch) may have added them
+        # since this one last looked; take the write lock, then re-read
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        self._refresh_columns(conn, stage)
+        for name in dict.fromkeys(missing):
+            if name not in self._columns[stage]:
+                conn.execute(f"ALTER TABLE {stage} ADD COLUMN {_quote(name)}")
+                self._columns[stage].append(name)
+
+    def _refresh_columns(self, conn, stage):
+        self._columns[stage] = [r[1] for r in conn.execute(f"PRAGMA table_info({stage})")][4:]
+
+    def _where(self, stage, run=None, since=None, until=None, image=None, defect=None):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        clauses, params = [], []
+        if run:
+            clauses.append("_run = ?")
+            params.append(run)
+        if since:
+            clauses.append("_time >= ?")
+            params.append(since)
+        if until:
+            clauses.append("_time < ?")
+            params.append(_until(until))
+        if image:
+            clauses.append("_image = ?")
+            params.append(image)
+        if defect:
+            clauses.append("id IN (SELECT row_id FROM defects WHERE stage = ? AND class = ?)")
+            params += [stage, defect]
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(path=None):
+    """Process-wide RunHistory per database file."""
+    path = path or HISTORY_DB
+    with _histories_lock:
+        history = _histories.get(path)
+        if history is None:
+            history = _histories[path] = RunHistory(path)
+    return history
+
+
+def append(stage, rows, run_id=None):
+    """get_history().append(...)"""
+    get_history().append(stage, rows, run_id)
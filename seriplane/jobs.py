@@ -0,0 +1,114 @@
+"""
+Background job queue for /execute.
+
+POST /execute only enqueues a job and returns its id. A single worker
+thread runs the queued jobs one after another (they share ./data and the
+result folders) and records per-stage / per-image progress events that
+app.py exposes as JSON status and as a server-sent-events stream.
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 50
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = "queued"          # queued -> running -> done / failed
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = {}              # latest event
+        self.events = []
+        self.result = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs run_fn(progress_callback) for each submitted job, in order."""
+
+    def __init__(self, run_fn):
+        self.run_fn = run_fn
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._serve, name="jobs", daemon=True)
+        self._worker.start()
+
+    def submit(self):
+        job = Job()
+        with self._cond:
+            self._jobs[job.id] = job
+            self._prune()
+        self._emit(job, {"event": "queued", "position": self._queue.qsize() + 1})
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def events(self, job, timeout=15.0):
+        """
+        Yield the job's events as they happen, ending after the final one.
+        Yields None every `timeout` seconds without news (for keep-alives).
+        """
+        for i in itertools.count():
+            with self._cond:
+                while i >= len(job.events) and job.status not in ("done", "failed"):
+                    if not self._cond.wait(timeout):
+                        break
+                event = job.events[i] if i < len(job.events) else None
+                finished = job.status in ("done", "failed")
+            if event is None and finished:
+                return
+            yield event
+
+    # ---------------- internals ----------------
+    def _emit(self, job, event, status=None):
+        with self._cond:
+            if status is not None:
+                # set together with the event so events() never misses the last one
+                job.status = status
+            event = {"time": time.time(), **event}
+            job.events.append(event)
+            job.progress = event
+            self._cond.notify_all()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in ("done", "failed")]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+    def _serve(self):
+        while True:
+            job = self._queue.get()
+            job.started = time.time()
+            self._emit(job, {"event": "started"}, status="running")
+            try:
+                job.result = self.run_fn(lambda **ev: self._emit(job, {"event": "progress", **ev}))
+            except Exception as e:
+                job.error = str(e)
+                status = "failed"
+            else:
+                status = "done"
+            job.finished = time.time()
+            self._emit(job, {"event": status}, status=status)
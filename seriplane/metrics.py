@@ -0,0 +1,337 @@
+"""
+Stage timing and memory instrumentation.
+
+    with metrics.stage("crop.detect", image="1.jpeg"):
+        ...
+
+Every stage records its wall time and the peak RSS of the process
+afterwards. With TRACE_MEMORY it also records the tracemalloc peak
+inside the stage. That peak includes NumPy buffers but not OpenCV's own
+allocations, and it is process-wide, so stages running at the same time
+on other threads show up in it too.
+
+Records go to two places:
+- process-wide totals, rendered in Prometheus text format by
+  render_prometheus() (GET /metrics in both Flask apps)
+- the current run (start_run() .. finish_run()), written as
+  results/timings_<run id>.json next to the result CSVs, with per-stage
+  totals and per-image stage times
+
+With PROFILE (or SERIPLANE_PROFILE=1) a sampling profiler also runs
+during each run. It writes collapsed stacks (flamegraph.pl / speedscope
+input) next to the timing JSON.
+
+Stages that run in worker processes (crop.main / evenness.main with a
+process pool) are measured there by collect() and handed back with each
+result; batch.imap_ordered merges them into the parent's totals and run.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:          # Windows
+    resource = None
+
+# ===================== SETTINGS =====================
+TIMINGS_DIR = "results"
+TRACE_MEMORY = False                                 # per-stage tracemalloc peaks (slower)
+PROFILE = os.environ.get("SERIPLANE_PROFILE") == "1"
+PROFILE_INTERVAL_S = 0.005
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# ====================================================
+
+_lock = threading.Lock()
+_stages = {}                 # stage -> {"count", "sum", "buckets", "peak_bytes"}
+_counters = Counter()        # (name, labels) -> value
+_gauges = {}                 # name -> callable returning a number
+_run = None                  # current run, see start_run()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextlib.contextmanager
+def stage(name, image=None):
+    """Time the with-block as stage `name` (optionally for one image)."""
+    traced = TRACE_MEMORY and tracemalloc.is_tracing()
+    if traced:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] - base if traced else None
+        record(name, seconds, image, peak)
+
+
+def record(name, seconds, image=None, peak_bytes=None):
+    """Add one measurement (used by stage(); call directly for pre-timed work)."""
+    with _lock:
+        _add_total(name, seconds, peak_bytes)
+        if _run is not None:
+            _run["records"].append({
+                "stage": name,
+                "image": image,
+                "seconds": round(seconds, 6),
+                "peak_bytes": peak_bytes,
+                "rss_peak_bytes": peak_rss_bytes(),
+            })
+
+
+def _add_total(name, seconds, peak_bytes):
+    s = _stages.get(name)
+    if s is None:
+        s = _stages[name] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS), "peak_bytes": 0}
+    s["count"] += 1
+    s["sum"] += seconds
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            s["buckets"][i] += 1
+    if peak_bytes:
+        s["peak_bytes"] = max(s["peak_bytes"], peak_bytes)
+
+
+def collect(func, *args):
+    """
+    func(*args) in a worker process; returns (result, the stage records it
+    made) for merge() in the parent.
+    """
+    global _run
+    with _lock:
+        # a forked worker may have inherited the parent's open run
+        outer, _run = _run, {"id": None, "records": [], "depth": 1}
+    try:
+        result = func(*args)
+    finally:
+        with _lock:
+            run, _run = _run, outer
+    return result, run["records"]
+
+
+def merge(records):
+    """Add stage records measured in another process (see collect())."""
+    with _lock:
+        for r in records:
+            _add_total(r["stage"], r["seconds"], r["peak_bytes"])
+            if _run is not None:
+                _run["records"].append(r)
+
+
+def count(name, n=1, **labels):
+    """Increment a counter, e.g. count("predict_requests", status="ok")."""
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += n
+
+
+def gauge(name, fn):
+    """Register a gauge whose value is read from fn() at scrape time."""
+    _gauges[name] = fn
+
+
+# --------------------------------------------------
+# RUNS
+# --------------------------------------------------
+def new_run_id():
+    """Timestamp id down to the microsecond; runs served from the cache take ~10 ms."""
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+
+def current_run_id():
+    """Id of the open run, or None."""
+    run = _run
+    return run["id"] if run is not None else None
+
+
+def start_run(run_id=None):
+    """
+    Start collecting records for a run; returns its id. Nested calls join
+    the run that is already open (engine.run inside the CLI's run).
+    """
+    global _run
+    with _lock:
+        if _run is not None:
+            _run["depth"] += 1
+            return _run["id"]
+        _run = {
+            "id": run_id or new_run_id(),
+            "started": time.time(),
+            "records": [],
+            "depth": 1,
+            "profiler": None,
+            "tracing": False,
+        }
+        run = _run
+
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        run["tracing"] = True
+    if PROFILE:
+        run["profiler"] = SamplingProfiler(PROFILE_INTERVAL_S)
+        run["profiler"].start()
+    return run["id"]
+
+
+def finish_run(out_dir=None):
+    """Close the run and write its timing JSON; returns the path (None for a nested call)."""
+    global _run
+    with _lock:
+        if _run is None:
+            return None
+        _run["depth"] -= 1
+        if _run["depth"] > 0:
+            return None
+        run, _run = _run, None
+
+    if run["tracing"]:
+        tracemalloc.stop()
+    out_dir = out_dir or TIMINGS_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"timings_{run['id']}.json")
+
+    report = run_summary(run)
+    if run["profiler"] is not None:
+        profile_path = os.path.join(out_dir, f"profile_{run['id']}.folded")
+        run["profiler"].stop()
+        run["profiler"].write(profile_path)
+        report["profile"] = profile_path
+
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def run_summary(run):
+    stages = defaultdict(lambda: {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_bytes": None})
+    images = defaultdict(lambda: defaultdict(float))
+    for r in run["records"]:
+        s = stages[r["stage"]]
+        s["count"] += 1
+        s["seconds"] += r["seconds"]
+        s["max_seconds"] = max(s["max_seconds"], r["seconds"])
+        if r["peak_bytes"]:
+            s["peak_bytes"] = max(s["peak_bytes"] or 0, r["peak_bytes"])
+        if r["image"]:
+            images[r["image"]][r["stage"]] += r["seconds"]
+
+    return {
+        "run_id": run["id"],
+        "started": datetime.fromtimestamp(run["started"]).strftime("%Y-%m-%d %H:%M:%S"),
+        "wall_seconds": round(time.time() - run["started"], 3),
+        "rss_peak_bytes": peak_rss_bytes(),
+        "stages": {k: {**v, "seconds": round(v["seconds"], 6), "max_seconds": round(v["max_seconds"], 6)}
+                   for k, v in sorted(stages.items())},
+        "images": {img: {k: round(v, 6) for k, v in st.items()} for img, st in sorted(images.items())},
+    }
+
+
+# --------------------------------------------------
+# PROMETHEUS
+# --------------------------------------------------
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render_prometheus(prefix="seriplane"):
+    """All metrics in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {prefix}_stage_seconds Wall time per pipeline stage.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    with _lock:
+        stages = {k: dict(v, buckets=list(v["buckets"])) for k, v in _stages.items()}
+        counters = dict(_counters)
+
+    for name, s in sorted(stages.items()):
+        for bound, n in zip(BUCKETS, s["buckets"]):
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {n}')
+        lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {s["count"]}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+
+    if any(s["peak_bytes"] for s in stages.values()):
+        lines += [f"# HELP {prefix}_stage_peak_bytes Largest tracemalloc peak seen inside a stage.",
+                  f"# TYPE {prefix}_stage_peak_bytes gauge"]
+        for name, s in sorted(stages.items()):
+            if s["peak_bytes"]:
+                lines.append(f'{prefix}_stage_peak_bytes{{stage="{name}"}} {s["peak_bytes"]}')
+
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total{_labels(labels)} {value}")
+
+    for name, fn in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+
+    rss = peak_rss_bytes()
+    if rss is not None:
+        lines.append(f"# TYPE {prefix}_process_peak_rss_bytes gauge")
+        lines.append(f"{prefix}_process_peak_rss_bytes {rss}")
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------
+# SAMPLING PROFILER
+# --------------------------------------------------
+class SamplingProfiler:
+    """Samples every thread's Python stack at a fixed interval; no tracing overhead."""
+
+    def __init__(self, interval_s=PROFILE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        """Collapsed stacks, one `frame;frame;frame count` line per stack."""
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(parts))] += 1
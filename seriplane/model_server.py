@@ -0,0 +1,235 @@
+"""
+Long-lived YOLO inference service.
+
+The weights are loaded once and warmed up with a dummy forward pass.
+Images submitted from any thread (a batch folder in neatness.py, or
+overlapping /predict requests in yolo/app.py) are queued and a worker
+thread groups them into one batched forward pass of at most
+MAX_BATCH_SIZE images, waiting at most MAX_WAIT_MS for a batch to fill.
+
+With workers > 1 a fixed pool of threads, each with its own copy of the
+model, takes batches from the same queue. With max_queue > 0 the queue
+is bounded and submit() raises ServerBusy instead of letting latency
+pile up behind a burst.
+
+The backend is pluggable: "ultralytics" runs the .pt weights through
+torch, and "onnxruntime" / "openvino" run an ONNX export of them on CPU
+(exported on first use if only the .pt is there).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+# ===================== SETTINGS =====================
+MAX_BATCH_SIZE = 8        # images per forward pass
+MAX_WAIT_MS = 20          # how long the first image waits for company
+WARMUP_SIZE = 640         # side of the blank warm-up image (px)
+MAX_QUEUE = 0             # images waiting at most (0 = unbounded)
+WORKERS = 1               # model copies / worker threads
+BACKEND = "ultralytics"   # "ultralytics", or "onnxruntime" / "openvino" (see onnx_backend.py)
+# ====================================================
+
+
+class ServerBusy(RuntimeError):
+    """The inference queue is full; the caller should retry later."""
+
+
+def load_model(model_path, backend=BACKEND):
+    """
+    A callable detector (list of BGR images -> results) for the backend.
+    backend may also be a factory taking the model path (bench.StubDetector).
+    """
+    if callable(backend):
+        return backend(model_path)
+
+    if backend == "ultralytics":
+        from ultralytics import YOLO
+        return YOLO(model_path)
+
+    if backend in ("onnxruntime", "openvino"):
+        import onnx_backend
+        if model_path.endswith(".pt"):
+            model_path = onnx_backend.export(model_path)
+        return onnx_backend.OnnxYOLO(model_path, runtime=backend)
+
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+
+def weights_file(model_path, backend=BACKEND):
+    """The file load_model(model_path, backend) reads the weights from."""
+    if backend in ("onnxruntime", "openvino") and model_path.endswith(".pt"):
+        import onnx_backend
+        onnx_path = onnx_backend.onnx_path_for(model_path)
+        # before the first export, the .pt it will be exported from
+        if os.path.exists(onnx_path) or not os.path.exists(model_path):
+            return onnx_path
+    return model_path
+
+
+class ModelServer:
+    """Owns the YOLO model(s) and serves batched predictions from a queue."""
+
+    def __init__(self, model_path, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS, warm_up=True,
+                 max_queue=MAX_QUEUE, workers=WORKERS, backend=BACKEND):
+        self.model_path = model_path
+        self.backend = backend
+        self.models = [load_model(model_path, backend) for _ in range(max(1, int(workers)))]
+        self.model = self.models[0]
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue(maxsize=max(0, int(max_queue)))
+        self._closed = False
+        if warm_up:
+            self.warm_up()
+
+        self._workers = [
+            threading.Thread(target=self._serve, args=(model,), name=f"yolo-server-{i}", daemon=True)
+            for i, model in enumerate(self.models)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # ---------------- public API ----------------
+    def warm_up(self):
+        """One dummy pass so the first real request doesn't pay for lazy init."""
+        blank = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+        for model in self.models:
+            model([blank] * self.max_batch_size, verbose=False)
+
+    def submit(self, img, block=True):
+        """
+        Queue one BGR image; returns a Future resolving to its YOLO result.
+        With block=False a full queue raises ServerBusy instead of waiting.
+        """
+        if self._closed:
+            raise RuntimeError("model server is closed")
+        fut = Future()
+        try:
+            self._queue.put((img, fut), block=block)
+        except queue.Full:
+            raise ServerBusy(f"inference queue full ({self._queue.maxsize} images)") from None
+        return fut
+
+    def queued(self):
+        """Images currently waiting for a worker."""
+        return self._queue.qsize()
+
+    def predict(self, img, timeout=None):
+        """Blocking single-image prediction (batched with any concurrent callers)."""
+        return self.submit(img).result(timeout)
+
+    def predict_many(self, imgs, timeout=None):
+        """Predict a list of images; results come back in input order."""
+        futures = [self.submit(img) for img in imgs]
+        return [f.result(timeout) for f in futures]
+
+    def close(self):
+        """Stop the workers after the queued images are done."""
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    # ---------------- worker ----------------
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    # past the deadline: only take what is already queued
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _serve(self, model):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            imgs = [img for img, _ in batch]
+            try:
+                results = model(imgs, verbose=False)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+
+def detections_from_result(result):
+    """
+    Plain-array view of one Ultralytics result:
+    {"boxes": (N, 4) xyxy, "confidences": (N,), "classes": (N,) int,
+     "names": {class_id: name}}.
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        xyxy = np.zeros((0, 4), dtype=np.float32)
+        conf = np.zeros(0, dtype=np.float32)
+        cls = np.zeros(0, dtype=np.int64)
+    else:
+        xyxy = boxes.xyxy.cpu().numpy()
+        conf = boxes.conf.cpu().numpy()
+        cls = boxes.cls.cpu().numpy().astype(np.int64)
+    return {"boxes": xyxy, "confidences": conf, "classes": cls, "names": dict(result.names)}
+
+
+# BGR colors for neatness classes; anything else is drawn in white
+BOX_COLORS = {
+    "minor": (0, 255, 255),
+    "major": (0, 165, 255),
+    "supermajor": (0, 0, 255),
+    "super_major": (0, 0, 255),
+    "neatness": (255, 0, 255),
+}
+
+
+def draw_boxes(img, boxes, classes, confidences):
+    """Detection boxes with class / confidence labels onto img."""
+    thickness = max(2, int(round(min(img.shape[:2]) / 400)))
+    for (x1, y1, x2, y2), cls, conf in zip(boxes, classes, confidences):
+        color = BOX_COLORS.get(cls, (255, 255, 255))
+        p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+        cv2.rectangle(img, p1, p2, color, thickness)
+        cv2.putText(img, f"{cls} {conf:.2f}", (p1[0], max(p1[1] - 5, 15)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return img
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_server(model_path, **kwargs):
+    """Process-wide server per weights file and backend, started on first use."""
+    key = (model_path, kwargs.get("backend", BACKEND))
+    with _servers_lock:
+        server = _servers.get(key)
+        if server is None:
+            server = _servers[key] = ModelServer(model_path, **kwargs)
+    return server
@@ -1,8 +1,11 @@
 import os
 import cv2
 import numpy as np
-import pandas as pd
-from ultralytics import YOLO
+import history
+import metrics
+import results_store
+import tiling
+from model_server import get_server, detections_from_result, draw_boxes
 from collections import defaultdict
 from datetime import datetime
 
@@ -19,17 +22,67 @@ CSV_LOG = os.path.join("results", "neatness_cleanness.csv")
 
 IMG_EXT = {".jpg", ".jpeg", ".png"}
 
-# create required folders
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# images decoded and sent to the model server at once by run_batch_yolo
+BATCH_SIZE = 8
+
+# "ultralytics" (torch, .pt) or "onnxruntime" / "openvino" (CPU, ONNX
+# exported from MODEL_PATH on first use; see onnx_backend.py)
+INFERENCE_BACKEND = "ultralytics"
+
+# False = skip results[0].plot() + JPEG; boxes go to the results store
+# and app.py draws them on demand (/render/neatness/<image>)
+RENDER_ANNOTATED = True
+
+# tiled inference: strips are cut into TILE_SIZE tiles (about the model
+# input size) instead of being letterboxed down whole; all tiles of a
+# batch go through the model server together, boxes are merged with NMS
+TILED = False
+TILE_SIZE = 640
+TILE_OVERLAP = 128                # px shared by neighbouring tiles
+TILE_NMS_THRESHOLD = 0.5
+TILE_NMS_METRIC = "ios"           # "iou", or "ios" (also drops boxes cut off at a tile edge)
 
 # defect category groups
 CLEANLINESS_CLASSES = {"minor", "major", "supermajor", "super_major"}
 NEATNESS_CLASSES = {"neatness"}
 
+_model_digest = {}
+
+
+def cache_params():
+    """Model identity for result-cache keys (hash of the weights file the backend loads)."""
+    from cache import file_digest
+    from model_server import weights_file
+
+    path = weights_file(MODEL_PATH, INFERENCE_BACKEND)
+    if os.path.isfile(path):
+        stamp = (path, os.path.getmtime(path))
+        if _model_digest.get("stamp") != stamp:
+            _model_digest.update(stamp=stamp, sha256=file_digest(path))
+        model = _model_digest["sha256"]
+    else:
+        # no weights yet: load_model reports that when neatness runs;
+        # the key only has to differ from any real model's
+        model = f"missing:{path}"
+    return {
+        "model": model,
+        "backend": INFERENCE_BACKEND,
+        "classes": sorted(CLEANLINESS_CLASSES | NEATNESS_CLASSES),
+        "render_annotated": RENDER_ANNOTATED,
+        "tiling": [TILE_SIZE, TILE_OVERLAP, TILE_NMS_THRESHOLD, TILE_NMS_METRIC] if TILED else None,
+    }
+
+
 # --------------------------------------------------
 # LOAD YOLO MODEL
 # --------------------------------------------------
-model = YOLO(MODEL_PATH)
+def load_model():
+    """
+    Model server for MODEL_PATH. The weights are loaded and warmed up once
+    per process; images are grouped into batched forward passes.
+    """
+    return get_server(MODEL_PATH, max_batch_size=BATCH_SIZE, backend=INFERENCE_BACKEND)
+
 
 def run_batch_yolo(folder_path):
     """
@@ -42,6 +95,7 @@ def run_batch_yolo(folder_path):
         return
 
     results_list = []
+    pending = []
 
     # ------------------------------------------
     # PROCESS ALL IMAGES
@@ -53,49 +107,143 @@ def run_batch_yolo(folder_path):
 
         img_path = os.path.join(folder_path, filename)
 
-        img = cv2.imread(img_path)
+        with metrics.stage("neatness.decode", filename):
+            img = cv2.imread(img_path)
         if img is None:
             continue
 
-        # run inference
-        results = model(img)
-        annotated = results[0].plot()
+        pending.append((filename, img))
+        if len(pending) == BATCH_SIZE:
+            results_list.extend(run_batch_history(pending))
+            pending = []
+
+    if pending:
+        results_list.extend(run_batch_history(pending))
+
+    write_csv(results_list)
+    return results_list
+
+
+def run_batch_history(strips):
+    """run_batch_arrays, with the rows added to the run history."""
+    rows = run_batch_arrays(strips)
+    history.append("neatness", rows)
+    return rows
+
+
+def run_batch_arrays(strips):
+    """
+    Same as run_batch_yolo for already decoded strips, given as
+    (filename, img_bgr) pairs. Returns the CSV rows without writing them.
+    """
+    if TILED:
+        dets = detect_tiled([img for _, img in strips])
+        return [build_tiled_row(filename, img, det) for (filename, img), det in zip(strips, dets)]
+
+    with metrics.stage("neatness.infer"):
+        results = load_model().predict_many([img for _, img in strips])
+    return [build_row(filename, res) for (filename, _), res in zip(strips, results)]
+
+
+def analyse_image(img, filename):
+    """Run YOLO on one BGR image, save the annotated copy, return the CSV row."""
+    if TILED:
+        return run_batch_arrays([(filename, img)])[0]
+    with metrics.stage("neatness.infer", filename):
+        result = load_model().predict(img)
+    return build_row(filename, result)
+
+
+def detect_tiled(imgs):
+    """Detections per image from overlapping tiles, merged across tiles with NMS."""
+    tiles, owners = [], []
+    for i, img in enumerate(imgs):
+        for x0, y0, x1, y1 in tiling.tile_grid(img.shape, TILE_SIZE, TILE_OVERLAP):
+            tiles.append(np.ascontiguousarray(img[y0:y1, x0:x1]))
+            owners.append((i, x0, y0))
+
+    with metrics.stage("neatness.infer"):
+        results = load_model().predict_many(tiles)
+
+    parts = [[] for _ in imgs]
+    for (i, x0, y0), res in zip(owners, results):
+        parts[i].append((detections_from_result(res), x0, y0))
+    return [tiling.merge_detections(p, TILE_NMS_THRESHOLD, TILE_NMS_METRIC) for p in parts]
+
+
+def build_row(filename, result):
+    """Save the annotated image for one YOLO result and return its CSV row."""
+    return detections_row(filename, detections_from_result(result), result.orig_shape, result.plot)
+
+
+def build_tiled_row(filename, img, det):
+    """build_row for merged tile detections; boxes are drawn like /render does."""
+    def plot():
+        labels = [det["names"][int(c)] for c in det["classes"]]
+        return draw_boxes(img.copy(), det["boxes"], labels, det["confidences"])
+
+    return detections_row(filename, det, img.shape, plot)
+
+
+def detections_row(filename, det, shape, plot):
+    """Store the boxes, save plot() as the annotated image, return the CSV row."""
+    class_names = det["names"]
+    results_store.append(box_record(filename, shape, det))
+
+    if RENDER_ANNOTATED:
+        with metrics.stage("neatness.plot", filename):
+            annotated = plot()
 
         # save annotated image
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
         output_path = os.path.join(OUTPUT_DIR, filename)
-        cv2.imwrite(output_path, annotated)
+        with metrics.stage("neatness.save", filename):
+            cv2.imwrite(output_path, annotated)
+    else:
+        output_path = f"/render/neatness/{filename}"
 
-        # defect counting
-        defect_counts = defaultdict(int)
-        total_defects = 0
+    # defect counting
+    defect_counts = defaultdict(int)
+    total_defects = 0
 
-        if results[0].boxes is not None:
-            class_ids = results[0].boxes.cls.cpu().numpy()
-            class_names = results[0].names
+    for cid in det["classes"]:
+        cls_name = class_names[int(cid)]
+        defect_counts[cls_name] += 1
+        total_defects += 1
 
-            for cid in class_ids:
-                cls_name = class_names[int(cid)]
-                defect_counts[cls_name] += 1
-                total_defects += 1
+    cleanliness = {cls: defect_counts.get(cls, 0) for cls in CLEANLINESS_CLASSES}
+    neatness = {cls: defect_counts.get(cls, 0) for cls in NEATNESS_CLASSES}
 
-        cleanliness = {cls: defect_counts.get(cls, 0) for cls in CLEANLINESS_CLASSES}
-        neatness = {cls: defect_counts.get(cls, 0) for cls in NEATNESS_CLASSES}
+    return {
+        "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Image_Name": filename,
+        **{f"Cleanliness_{k}": cleanliness[k] for k in CLEANLINESS_CLASSES},
+        **{f"Neatness_{k}": neatness[k] for k in NEATNESS_CLASSES},
+        "Total_Defects": total_defects,
+        "Output_Image_Path": output_path
+    }
 
-        row = {
-            "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "Image_Name": filename,
-            **{f"Cleanliness_{k}": cleanliness[k] for k in CLEANLINESS_CLASSES},
-            **{f"Neatness_{k}": neatness[k] for k in NEATNESS_CLASSES},
-            "Total_Defects": total_defects,
-            "Output_Image_Path": output_path
-        }
 
-        results_list.append(row)
+def box_record(filename, shape, det):
+    """Results-store record for one strip: boxes, classes, confidences."""
+    h, w = shape[:2]
+    return {
+        "stage": "neatness",
+        "image": filename,
+        "width": int(w),
+        "height": int(h),
+        "boxes": np.round(det["boxes"], 1).tolist(),
+        "classes": [det["names"][int(c)] for c in det["classes"]],
+        "confidences": np.round(det["confidences"], 4).tolist(),
+    }
 
-    # ------------------------------------------
-    # SAVE CSV
-    # ------------------------------------------
+
+def write_csv(results_list):
+    """Save the per-image rows as the neatness / cleanliness CSV."""
     if results_list:
+        import pandas as pd
+
+        os.makedirs(os.path.dirname(CSV_LOG) or ".", exist_ok=True)
         df = pd.DataFrame(results_list)
         df.to_csv(CSV_LOG, index=False)
         print("✅ CSV saved:", CSV_LOG)
@@ -104,8 +252,12 @@ def run_batch_yolo(folder_path):
         print("⚠️ No valid images found.")
 
 
+def main():
+    return run_batch_yolo(INPUT_DIR)
+
+
 # --------------------------------------------------
 # MAIN ENTRY
 # --------------------------------------------------
 if __name__ == "__main__":
-    run_batch_yolo(INPUT_DIR)
+    main()
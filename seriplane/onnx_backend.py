@@ -0,0 +1,207 @@
+"""
+ONNX Runtime / OpenVINO CPU backend for the YOLO detector.
+
+export() turns the .pt weights into ONNX once (optionally INT8-quantized).
+OnnxYOLO then runs that file without torch or ultralytics. It is a
+drop-in for ultralytics.YOLO inside model_server: called with a list of
+BGR images, it returns results with .boxes (xyxy / conf / cls), .names,
+.orig_shape and .plot(). Class names come from the exported model, so
+the CLEANLINESS_CLASSES / NEATNESS_CLASSES mapping is unchanged.
+
+Pre-processing matches Ultralytics: letterbox to imgsz with grey (114)
+padding, BGR -> RGB, scale to 0..1. Post-processing decodes the
+(4 + classes) x anchors output, filters by confidence and applies
+class-wise NMS.
+"""
+import ast
+import json
+import os
+
+import cv2
+import numpy as np
+
+import tiling
+
+# ===================== SETTINGS =====================
+IMGSZ = 640                 # export / inference input size
+CONF_THRESHOLD = 0.25       # ultralytics predict defaults
+IOU_THRESHOLD = 0.7
+MAX_DET = 300
+INT8 = False                # dynamic INT8 quantization of the weights (onnxruntime)
+# ====================================================
+
+PAD_VALUE = 114
+
+
+def onnx_path_for(pt_path, int8=INT8):
+    stem = os.path.splitext(pt_path)[0]
+    return f"{stem}.int8.onnx" if int8 else f"{stem}.onnx"
+
+
+def export(pt_path, int8=INT8, imgsz=IMGSZ):
+    """
+    Export pt_path to ONNX next to it (re-exported only when the .pt is
+    newer) and return the .onnx path. Needs ultralytics; the stations
+    only need the exported file, and without the .pt it is used as is.
+    """
+    out_path = onnx_path_for(pt_path, int8)
+    if not os.path.exists(pt_path):
+        if os.path.exists(out_path):
+            return out_path
+        raise FileNotFoundError(f"Neither {pt_path} nor {out_path} exists")
+    if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(pt_path):
+        return out_path
+
+    from ultralytics import YOLO
+
+    model = YOLO(pt_path)
+    fp32_path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    names = {int(k): v for k, v in model.names.items()}
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, out_path, weight_type=QuantType.QUInt8)
+    elif os.path.abspath(fp32_path) != os.path.abspath(out_path):
+        os.replace(fp32_path, out_path)
+
+    with open(out_path + ".json", "w") as f:
+        json.dump({"names": names, "imgsz": imgsz}, f)
+    return out_path
+
+
+def letterbox(img, size=IMGSZ):
+    """Resize keeping aspect ratio and pad to size x size; returns (img, gain, (pad_x, pad_y))."""
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                             value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return img, gain, (left, top)
+
+
+def preprocess(imgs, size=IMGSZ):
+    """BGR images -> float32 NCHW batch plus per-image (gain, pad)."""
+    batch = np.empty((len(imgs), 3, size, size), dtype=np.float32)
+    meta = []
+    for i, img in enumerate(imgs):
+        boxed, gain, pad = letterbox(img, size)
+        batch[i] = boxed[:, :, ::-1].transpose(2, 0, 1)
+        meta.append((gain, pad))
+    batch /= 255.0
+    return batch, meta
+
+
+def postprocess(pred, shape, gain, pad, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, max_det=MAX_DET):
+    """One image's (4 + nc, anchors) output -> xyxy boxes, scores, classes in image pixels."""
+    pred = pred.T
+    cls_scores = pred[:, 4:]
+    classes = cls_scores.argmax(axis=1)
+    scores = cls_scores[np.arange(len(classes)), classes]
+    keep = scores > conf
+    pred, scores, classes = pred[keep], scores[keep], classes[keep]
+
+    cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    keep = tiling.nms(boxes, scores, classes, iou)[:max_det]
+    boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+    boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+    boxes /= gain
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+    return boxes.astype(np.float32), scores.astype(np.float32), classes.astype(np.int64)
+
+
+class _Tensor:
+    """numpy array with the .cpu().numpy() chain callers use on torch tensors."""
+
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy, self.conf, self.cls = _Tensor(xyxy), _Tensor(conf), _Tensor(cls)
+
+    def __len__(self):
+        return len(self.cls.array)
+
+
+class Result:
+    """The parts of an ultralytics Results object the services use."""
+
+    def __init__(self, img, boxes, names):
+        self.orig_img = img
+        self.orig_shape = img.shape[:2]
+        self.boxes = boxes
+        self.names = names
+
+    def plot(self):
+        from model_server import draw_boxes
+
+        labels = [self.names[int(c)] for c in self.boxes.cls.array]
+        return draw_boxes(self.orig_img.copy(), self.boxes.xyxy.array, labels, self.boxes.conf.array)
+
+
+class OnnxYOLO:
+    """Runs an exported YOLO .onnx with onnxruntime or openvino on CPU."""
+
+    def __init__(self, onnx_path, runtime="onnxruntime", imgsz=None,
+                 conf=CONF_THRESHOLD, iou=IOU_THRESHOLD):
+        self.onnx_path = onnx_path
+        self.runtime = runtime
+        self.conf = conf
+        self.iou = iou
+
+        meta = {}
+        if os.path.exists(onnx_path + ".json"):
+            with open(onnx_path + ".json") as f:
+                meta = json.load(f)
+
+        if runtime == "openvino":
+            import openvino as ov
+
+            core = ov.Core()
+            self._model = core.compile_model(core.read_model(onnx_path), "CPU")
+            self._run = lambda batch: self._model(batch)[self._model.output(0)]
+        else:
+            import onnxruntime as ort
+
+            session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+            input_name = session.get_inputs()[0].name
+            self._run = lambda batch: session.run(None, {input_name: batch})[0]
+            if not meta:
+                # ultralytics stores names / imgsz in the model metadata
+                props = session.get_modelmeta().custom_metadata_map
+                meta = {k: ast.literal_eval(props[k]) for k in ("names", "imgsz") if k in props}
+
+        if "names" not in meta:
+            raise ValueError(f"No class names found for {onnx_path}")
+        self.names = {int(k): v for k, v in meta["names"].items()}
+        size = imgsz or meta.get("imgsz", IMGSZ)
+        self.imgsz = size[0] if isinstance(size, (list, tuple)) else int(size)
+
+    def __call__(self, imgs, verbose=False):
+        if isinstance(imgs, np.ndarray):
+            imgs = [imgs]
+        batch, meta = preprocess(imgs, self.imgsz)
+        preds = self._run(batch)
+
+        results = []
+        for img, pred, (gain, pad) in zip(imgs, preds, meta):
+            boxes, scores, classes = postprocess(pred, img.shape, gain, pad, self.conf, self.iou)
+            results.append(Result(img, Boxes(boxes, scores, classes), self.names))
+        return results
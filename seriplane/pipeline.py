@@ -16,7 +16,15 @@ def run_step(cmd):
         sys.exit(result.returncode)
 
 
-def main():
+def run_subprocess_chain():
+    """Legacy mode: every stage in its own interpreter."""
+    for script in ["precrop.py", "crop.py", "evenness.py", "neatness.py"]:
+        run_step([sys.executable, script])
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
     # Make sure output folders exist
     #PREPROC_DIR.mkdir(parents=True, exist_ok=True)
     EVENNESS_DIR.mkdir(parents=True, exist_ok=True)
@@ -41,36 +49,15 @@ def main():
     #     print(f"Evenness result    : {evenness_result}")
     #     print(f"Neatness result    : {neatness_result}")
     
-    # --- Step 1: preprocessing.py ---
-    run_step(
-        [
-            sys.executable,
-            "precrop.py"
-        ]
-    )
-
-    run_step(
-            [
-                sys.executable,
-                "crop.py"
-            ]
-    )
-    
-    # --- Step 2: evenness.py ---
-    run_step(
-        [
-            sys.executable,
-            "evenness.py"
-        ]
-    )
-
-    # --- Step 3: neatness.py ---
-    run_step(
-        [
-            sys.executable,
-            "neatness.py"
-        ]
-    )
+    if "--subprocess" in argv:
+        run_subprocess_chain()
+        return
+
+    # precrop -> crop -> evenness -> neatness, all in this process
+    from engine import get_engine
+    timings = get_engine().run()
+    for name, seconds in timings.items():
+        print(f"{name:<9}: {seconds:.2f}s")
 
 
 if __name__ == "__main__":
@@ -1,99 +1,381 @@
-from PIL import Image
+import functools
+import json
 import os
+import shutil
+import subprocess
+import cv2
 
-def main():
-    # =========================================================
-    #                  USER SETTINGS
-    # =========================================================
+import metrics
+from batch import imap_ordered
 
-    # Folder containing images
-    input_folder = "./data"
+# =========================================================
+#                  USER SETTINGS
+# =========================================================
 
-    # Image DPI (must match your overlay/grid DPI)
-    dpi = 300
+# Folder containing images
+INPUT_DIR = "./data"
 
-    # Crop mode: choose ONE -> "px" or "cm"
-    crop_mode = "cm"   # "px" OR "cm"
+# Image DPI (must match your overlay/grid DPI)
+dpi = 300
 
-    # ---------------------------------------------------------
-    # Crop region definition
-    # (left, top, right, bottom)
-    # ---------------------------------------------------------
+# Crop mode: choose ONE -> "px" or "cm"
+crop_mode = "cm"   # "px" OR "cm"
 
-    # ---- If crop_mode = "px" ----
-    crop_px = {
-        "left": 100,      # pixels
-        "top": 200,
-        "right": 1200,
-        "bottom": 1600
-    }
+# ---------------------------------------------------------
+# Crop region definition
+# (left, top, right, bottom)
+# ---------------------------------------------------------
 
-    # ---- If crop_mode = "cm" ----
-    crop_cm = {
-        "left": 1.0,      # cm from LEFT
-        "top": 0.5,       # cm from TOP
-        "right": 19.0,    # cm from LEFT (as per your current logic)
-        "bottom": 12.0
-    }
+# ---- If crop_mode = "px" ----
+crop_px = {
+    "left": 100,      # pixels
+    "top": 200,
+    "right": 1200,
+    "bottom": 1600
+}
+
+# ---- If crop_mode = "cm" ----
+crop_cm = {
+    "left": 1.0,      # cm from LEFT
+    "top": 0.5,       # cm from TOP
+    "right": 19.0,    # cm from LEFT (as per your current logic)
+    "bottom": 12.0
+}
+
+# ---------------------------------------------------------
+# How the box is applied
+#   "roi"      : nothing is rewritten; the box is recorded in the
+#                folder's MANIFEST_NAME and crop.py / the engine use
+#                only that region of the decoded image
+#   "lossless" : JPEGs are cropped in place with jpegtran (no re-encode;
+#                the top-left corner snaps to the MCU grid and the few
+#                px left over are recorded as an ROI); PNGs are rewritten
+#   "rewrite"  : decode, crop and re-encode over the original (old way)
+# Files already handled are tracked in the manifest and never cropped twice.
+# ---------------------------------------------------------
+PRECROP_MODE = "roi"
+
+num_workers = None           # parallel images (None = all cores)
+JPEGTRAN = "jpegtran"        # libjpeg(-turbo) tool for "lossless"
+
+# =========================================================
+#               DO NOT EDIT BELOW
+# =========================================================
+
+VALID_EXTS = (".png", ".jpg", ".jpeg")
+MODES = ("roi", "lossless", "rewrite")
+MANIFEST_NAME = ".precrop.json"
+
+
+def cache_params():
+    """Settings that change the crop box (used in result-cache keys)."""
+    return {"dpi": dpi, "crop_mode": crop_mode, "crop_px": crop_px, "crop_cm": crop_cm}
 
-    # =========================================================
-    #               DO NOT EDIT BELOW
-    # =========================================================
 
+def crop_box(W, H):
+    """
+    Return the (left, top, right, bottom) crop box in pixels for an image
+    of size W x H, clamped to the image, or None if the box is empty.
+    """
     px_per_cm = dpi / 2.54
 
-    image_files = [
-        f for f in os.listdir(input_folder)
-        if f.lower().endswith((".png", ".jpg", ".jpeg"))
-    ]
+    # Convert crop coordinates to pixels
+    if crop_mode.lower() == "cm":
+        left   = int(round(crop_cm["left"]   * px_per_cm))
+        top    = int(round(crop_cm["top"]    * px_per_cm))
+        right  = int(round(crop_cm["right"]  * px_per_cm))
+        bottom = int(round(crop_cm["bottom"] * px_per_cm))
+    else:
+        left   = crop_px["left"]
+        top    = crop_px["top"]
+        right  = crop_px["right"]
+        bottom = crop_px["bottom"]
 
-    if not image_files:
-        print(f"❌ No image files found in {input_folder}")
-        return
+    # Clamp to image boundaries
+    left   = max(0, min(left, W))
+    right  = max(0, min(right, W))
+    top    = max(0, min(top, H))
+    bottom = max(0, min(bottom, H))
+
+    # Validate crop box
+    if right <= left or bottom <= top:
+        return None
+
+    return left, top, right, bottom
+
+
+def precrop_image(img_path):
+    """Crop one image in place. Returns True if the file was rewritten."""
+    from PIL import Image
+
+    img_name = os.path.basename(img_path)
+    img = Image.open(img_path).convert("RGB")
+    W, H = img.size
 
-    print(f"📂 Found {len(image_files)} image(s)\n")
+    box = crop_box(W, H)
+    if box is None:
+        print(f"❌ Invalid crop for {img_name}, skipped.")
+        return False
+    left, top, right, bottom = box
 
-    for img_name in image_files:
-        img_path = os.path.join(input_folder, img_name)
-        img = Image.open(img_path).convert("RGB")
-        W, H = img.size
+    # Crop image
+    cropped_img = img.crop(box)
+
+    # OVERWRITE original image
+    cropped_img.save(img_path)
+
+    print(f"✅ Cropped & replaced: {img_name}")
+    print(f"   Image size before: {W} x {H} px")
+    print(f"   Crop box (px): ({left}, {top}) → ({right}, {bottom})")
+    print(f"   Image size after : {cropped_img.size[0]} x {cropped_img.size[1]} px\n")
+    return True
+
+
+# ---------------------------------------------------------
+# MANIFEST: <folder>/.precrop.json, one entry per image
+#   box         region to use inside the file as it is now
+#   source_box  crop box on the original image
+#   cropped     True once the file itself has been cut down
+#   file        [size, mtime_ns] of the file the entry describes
+# ---------------------------------------------------------
+_manifests = {}              # manifest path -> (mtime_ns, entries)
+
+
+def manifest_path(folder):
+    return os.path.join(folder, MANIFEST_NAME)
+
+
+def load_manifest(folder):
+    """Manifest entries of folder ({} if precrop never ran there)."""
+    path = manifest_path(folder)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _manifests.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = _manifests[path] = (mtime, json.load(f))
+    return cached[1]
+
+
+def save_manifest(folder, entries):
+    path = manifest_path(folder)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(entries, f, indent=1)
+    os.replace(tmp, path)
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def manifest_entry(img_path):
+    """Manifest entry for img_path, or None if there is none or the file has changed since."""
+    entry = load_manifest(os.path.dirname(img_path) or ".").get(os.path.basename(img_path))
+    if entry is None:
+        return None
+    try:
+        return entry if entry["file"] == file_signature(img_path) else None
+    except FileNotFoundError:
+        return None
+
+
+def make_entry(img_path, box, source_size, source_box, cropped):
+    return {
+        "box": list(box),
+        "source_size": list(source_size),
+        "source_box": list(source_box),
+        "cropped": cropped,
+        "params": cache_params(),
+        "file": file_signature(img_path),
+    }
 
-        # Convert crop coordinates to pixels
-        if crop_mode.lower() == "cm":
-            left   = int(round(crop_cm["left"]   * px_per_cm))
-            top    = int(round(crop_cm["top"]    * px_per_cm))
-            right  = int(round(crop_cm["right"]  * px_per_cm))
-            bottom = int(round(crop_cm["bottom"] * px_per_cm))
-        else:
-            left   = crop_px["left"]
-            top    = crop_px["top"]
-            right  = crop_px["right"]
-            bottom = crop_px["bottom"]
 
-        # Clamp to image boundaries
-        left   = max(0, min(left, W))
-        right  = max(0, min(right, W))
-        top    = max(0, min(top, H))
-        bottom = max(0, min(bottom, H))
+def region_box(img_path, W, H, raw=True):
+    """
+    Box to use inside the W x H image at img_path. Files the manifest
+    does not know are treated as raw (crop_box) or, with raw=False, as
+    already cropped (the whole image).
+    """
+    entry = manifest_entry(img_path)
+    if entry is None:
+        return crop_box(W, H) if raw else (0, 0, W, H)
+    if entry["cropped"] or entry["params"] == cache_params():
+        return tuple(entry["box"])
+    # recorded as raw, but the crop settings changed since
+    return crop_box(W, H)
 
-        # Validate crop box
-        if right <= left or bottom <= top:
-            print(f"❌ Invalid crop for {img_name}, skipped.")
-            continue
 
-        # Crop image
-        cropped_img = img.crop((left, top, right, bottom))
+def _load(img_path, raw):
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"❌ Cannot read {os.path.basename(img_path)}, skipped.")
+        return None
+
+    H, W = img.shape[:2]
+    box = region_box(img_path, W, H, raw)
+    if box is None:
+        print(f"❌ Invalid crop for {os.path.basename(img_path)}, skipped.")
+        return None
+
+    left, top, right, bottom = box
+    return img[top:bottom, left:right]
+
+
+def load_cropped(img_path):
+    """
+    In-memory variant of precrop_image: decode the image with OpenCV and
+    return the cropped BGR region as a view, leaving the file untouched.
+    Files precrop has already cut down are not cropped a second time.
+    Returns None if the image cannot be read or the crop box is empty.
+    """
+    return _load(img_path, raw=True)
+
+
+def load_roi(img_path):
+    """
+    Decoded image (BGR) as crop.py should see it: the region recorded in
+    the manifest, or the whole image for files precrop has not seen.
+    """
+    return _load(img_path, raw=False)
+
+
+# ---------------------------------------------------------
+# LOSSLESS JPEG CROP
+# ---------------------------------------------------------
+def jpeg_mcu(im):
+    """(width, height) of a PIL JPEG's MCU in px; None for other formats."""
+    if im.format != "JPEG":
+        return None
+    if len(im.layer) == 1:
+        return 8, 8
+    return 8 * max(c[1] for c in im.layer), 8 * max(c[2] for c in im.layer)
+
+
+def mcu_align(box, mcu):
+    """
+    box with its top-left corner moved up/left onto the MCU grid (what
+    jpegtran can cut without re-encoding), and box relative to that.
+    """
+    left, top, right, bottom = box
+    mw, mh = mcu
+    al, at = left - left % mw, top - top % mh
+    return (al, at, right, bottom), (left - al, top - at, right - al, bottom - at)
+
+
+def jpegtran_crop(img_path, box, mcu):
+    """Crop a JPEG in place with jpegtran; returns the box inside the new file."""
+    (al, at, right, bottom), inner = mcu_align(box, mcu)
+    tmp = img_path + ".precrop.tmp"
+    cmd = [JPEGTRAN, "-copy", "all", "-crop", f"{right - al}x{bottom - at}+{al}+{at}",
+           "-outfile", tmp, img_path]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        os.replace(tmp, img_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return inner
+
+
+# ---------------------------------------------------------
+# ONE FILE
+# ---------------------------------------------------------
+def precrop_file(img_path, mode=PRECROP_MODE):
+    """
+    Apply the crop box to one image according to mode. Returns its
+    manifest entry, or None if the image was skipped.
+    """
+    from PIL import Image
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown precrop mode: {mode}")
+
+    img_name = os.path.basename(img_path)
+    entry = manifest_entry(img_path)
+    if entry is not None and entry["cropped"]:
+        if entry["params"] != cache_params():
+            print(f"⚠️ {img_name} was cropped with other settings, left as is.")
+        return entry
+    if entry is not None and mode == "roi" and entry["params"] == cache_params():
+        return entry
+
+    # header only; nothing is decoded here
+    with Image.open(img_path) as im:
+        W, H = im.size
+        mcu = jpeg_mcu(im)
+
+    box = crop_box(W, H)
+    if box is None:
+        print(f"❌ Invalid crop for {img_name}, skipped.")
+        return None
+
+    if mode == "lossless" and mcu is None:
+        mode = "rewrite"        # PNG: re-encoding is lossless anyway
+    elif mode == "lossless" and shutil.which(JPEGTRAN) is None:
+        print(f"⚠️ {JPEGTRAN} not found, crop box of {img_name} recorded as ROI.")
+        mode = "roi"
+
+    if mode == "roi":
+        return make_entry(img_path, box, (W, H), box, cropped=False)
+
+    if mode == "lossless":
+        try:
+            inner = jpegtran_crop(img_path, box, mcu)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"⚠️ jpegtran failed on {img_name} ({e}), crop box recorded as ROI.")
+            return make_entry(img_path, box, (W, H), box, cropped=False)
+        print(f"✅ Losslessly cropped: {img_name} {box}")
+        return make_entry(img_path, inner, (W, H), box, cropped=True)
+
+    if not precrop_image(img_path):
+        return None
+    left, top, right, bottom = box
+    return make_entry(img_path, (0, 0, right - left, bottom - top), (W, H), box, cropped=True)
+
+
+def list_images(input_folder=INPUT_DIR):
+    """Sorted paths of the raw images inside input_folder."""
+    return [
+        os.path.join(input_folder, f) for f in sorted(os.listdir(input_folder))
+        if f.lower().endswith(VALID_EXTS)
+    ]
+
+
+def precrop_timed(img_path, mode):
+    with metrics.stage("precrop", os.path.basename(img_path)):
+        return precrop_file(img_path, mode)
+
+
+def main(input_folder=INPUT_DIR, mode=None, workers=None):
+    mode = mode or PRECROP_MODE
+    workers = num_workers if workers is None else workers
+    image_files = list_images(input_folder)
+
+    if not image_files:
+        print(f"❌ No image files found in {input_folder}")
+        return
+
+    print(f"📂 Found {len(image_files)} image(s), mode: {mode}\n")
 
-        # OVERWRITE original image
-        cropped_img.save(img_path)
+    # threads: header reads, jpegtran and PIL all spend their time outside the GIL
+    entries = dict(load_manifest(input_folder))
+    work = functools.partial(precrop_timed, mode=mode)
+    for path, entry in zip(image_files, imap_ordered(work, image_files, workers, use_threads=True)):
+        if entry is not None:
+            entries[os.path.basename(path)] = entry
 
-        print(f"✅ Cropped & replaced: {img_name}")
-        print(f"   Image size before: {W} x {H} px")
-        print(f"   Crop box (px): ({left}, {top}) → ({right}, {bottom})")
-        print(f"   Image size after : {cropped_img.size[0]} x {cropped_img.size[1]} px\n")
+    # forget files that are gone
+    names = {os.path.basename(p) for p in image_files}
+    entries = {k: v for k, v in entries.items() if k in names}
+    save_manifest(input_folder, entries)
 
-    print("🎯 Pre-cropping completed successfully.")
+    n_roi = sum(not e["cropped"] for e in entries.values())
+    print(f"🎯 Pre-cropping completed: {len(entries) - n_roi} file(s) cropped, {n_roi} as ROI.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,111 @@
+"""
+Column-profile store for re-scoring evenness without decoding strips.
+
+For every strip it analyses, evenness.py saves what the thresholding
+needs and nothing more:
+
+    results/profiles/<YYYY-MM-DD>/<strip name>@<content hash>.npy
+
+Each file holds one record with the strip height, its 256-bin grayscale
+histogram (mean, mode and percentiles come from it) and the sum of every
+pixel column (column means for any column_width). That is about 11 KB
+for an 1100 px wide strip. Files are opened memory-mapped.
+
+    python cli.py rescore [--since 2026-01-01] [--v1 4 --v2 7 --v3 10] ...
+
+re-scores every stored strip with new settings (see evenness.rescore).
+The content hash keeps strips of different planes that share a name
+(1_strip1.jpg from every batch) apart; the same strip analysed twice on
+one day is stored once.
+"""
+import fnmatch
+import hashlib
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+PROFILE_DIR = os.path.join("results", "profiles")
+
+_dtypes = {}            # .npy header bytes -> record dtype
+
+
+def profile_dtype(width):
+    return np.dtype([
+        ("height", "<i8"),
+        ("hist", "<i8", (256,)),
+        ("col_sums", "<i8", (width,)),
+    ])
+
+
+def save(image, height, hist, col_sums, day=None, root=None):
+    """Store one strip's profile; returns the file path."""
+    folder = os.path.join(root or PROFILE_DIR, day or time.strftime("%Y-%m-%d"))
+    os.makedirs(folder, exist_ok=True)
+
+    record = np.zeros(1, dtype=profile_dtype(len(col_sums)))
+    record["height"] = height
+    record["hist"] = hist
+    record["col_sums"] = col_sums
+
+    # write + rename, so readers never see half a file
+    digest = hashlib.sha1(record.tobytes()).hexdigest()[:12]
+    path = os.path.join(folder, f"{image}@{digest}.npy")
+    if os.path.exists(path):
+        return path
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+    np.save(tmp, record)
+    os.replace(tmp, path)
+    return path
+
+
+def load(path):
+    """(height, hist, col_sums) of one stored profile; the arrays are memory-mapped."""
+    # np.load parses the header with ast for every file; all profiles of
+    # one width share the same header, so it is only parsed once here
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        size_fmt = "<H" if version == (1, 0) else "<I"
+        header = f.read(struct.calcsize(size_fmt))
+        header += f.read(struct.unpack(size_fmt, header)[0])
+        offset = f.tell()
+        dtype = _dtypes.get(header)
+        if dtype is None:
+            f.seek(offset - len(header))
+            read = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                    else np.lib.format.read_array_header_2_0)
+            dtype = _dtypes[header] = read(f)[2]
+
+    record = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(1,))[0]
+    return int(record["height"]), record["hist"], record["col_sums"]
+
+
+def days(root=None):
+    """Days with stored profiles, oldest first."""
+    root = root or PROFILE_DIR
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+
+def iter_profiles(since=None, until=None, pattern=None, root=None):
+    """
+    (day, image, path) of the stored profiles, oldest day first. since /
+    until are inclusive YYYY-MM-DD bounds; pattern filters image names
+    (shell wildcards).
+    """
+    root = root or PROFILE_DIR
+    for day in days(root):
+        if (since and day < since) or (until and day > until):
+            continue
+        folder = os.path.join(root, day)
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith(".npy") or name.endswith(".tmp.npy"):
+                continue
+            # <image>@<hash>.npy (<image>.npy from before the hash was added)
+            image = name[:-len(".npy")].rsplit("@", 1)[0]
+            if pattern and not fnmatch.fnmatch(image, pattern):
+                continue
+            yield day, image, os.path.join(folder, name)
@@ -0,0 +1,83 @@
+"""
+On-demand rendering of stored results.
+
+Draws evenness regions or neatness boxes from a results_store record onto
+the strip they belong to, and keeps the JPEG in RENDER_CACHE_DIR so each
+variant is encoded at most once per record.
+"""
+import hashlib
+import json
+import os
+
+import cv2
+
+import crop
+import evenness
+import results_store
+from model_server import draw_boxes
+
+RENDER_CACHE_DIR = os.path.join("results", "render_cache")
+
+# where the plain strips can be found (first match wins)
+STRIP_DIRS = [os.path.join("results", "strips"), crop.OUTPUT_DIR]
+
+
+def find_strip(image):
+    for folder in STRIP_DIRS:
+        path = os.path.join(folder, image)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def draw_evenness(img, record, comparator=None):
+    """Regions of one comparator (or all of them, stacked) onto img."""
+    names = [comparator] if comparator else list(record["comparators"])
+    for i, name in enumerate(names):
+        regions = [tuple(r) for r in record["comparators"][name]["regions"]]
+        evenness.draw_regions(img, regions, label_prefix=f"{name.upper()} ",
+                              inset=i * 15, label_row=i,
+                              col_width=record["column_width"])
+    return img
+
+
+def draw_neatness(img, record):
+    return draw_boxes(img, record["boxes"], record["classes"], record["confidences"])
+
+
+def render(stage, image, comparator=None, store=None):
+    """
+    Path of the rendered JPEG for (stage, image), drawing it if needed.
+    Returns None if there is no record or no strip to draw on.
+    """
+    store = store or results_store.ResultsStore()
+    record = store.get(stage, image)
+    if record is None:
+        return None
+
+    variant = comparator or "all"
+    digest = hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()[:12]
+    stem = os.path.splitext(image)[0]
+    out_path = os.path.join(RENDER_CACHE_DIR, stage, f"{stem}_{variant}_{digest}.jpg")
+    if os.path.exists(out_path):
+        return out_path
+
+    strip_path = find_strip(image)
+    if strip_path is None:
+        return None
+    img = cv2.imread(strip_path)
+    if img is None:
+        return None
+
+    if stage == "evenness":
+        if comparator and comparator not in record["comparators"]:
+            return None
+        draw_evenness(img, record, comparator)
+    elif stage == "neatness":
+        draw_neatness(img, record)
+    else:
+        return None
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    cv2.imwrite(out_path, img)
+    return out_path
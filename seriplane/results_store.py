@@ -0,0 +1,123 @@
+"""
+Vector results store.
+
+Every analysed strip gets one JSON line in STORE_PATH holding what was
+found rather than a picture of it: evenness regions, counts and deviation
+arrays per comparator, and neatness boxes, classes and confidences.
+Annotated images can then be drawn on demand (see render.py and the
+/render endpoint in app.py) instead of being JPEG-encoded for every strip.
+
+Lines are only ever appended, with one write() per record, so several
+worker processes can add to the file at once. For each (stage, image)
+the most recent record wins.
+
+Once the file passes MAX_BYTES it is renamed to regions.jsonl.<time>
+and a new one is started; only the KEEP_ROTATED newest of those are
+kept. A write racing the rename still lands in the renamed file, which
+the reader goes on reading.
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+# ===================== SETTINGS =====================
+STORE_PATH = os.path.join("results", "regions.jsonl")
+MAX_BYTES = 64 * 1024 ** 2      # rotate the store beyond this size
+KEEP_ROTATED = 3                # rotated files kept (oldest removed first)
+# ====================================================
+
+
+def append(record, path=None):
+    """Append one record ({"stage": ..., "image": ..., ...}) to the store."""
+    path = path or STORE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    record = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), **record}
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+        size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+    if size > MAX_BYTES:
+        rotate(path)
+
+
+def rotated_files(path=None):
+    """Rotated stores of path, oldest first."""
+    path = path or STORE_PATH
+    found = [p for p in glob.glob(glob.escape(path) + ".*") if p.rsplit(".", 1)[1].isdigit()]
+    return sorted(found, key=lambda p: int(p.rsplit(".", 1)[1]))
+
+
+def rotate(path=None):
+    """Start a new store file and drop the oldest rotated ones."""
+    path = path or STORE_PATH
+    try:
+        if os.path.getsize(path) <= MAX_BYTES:
+            return          # another process rotated it already
+        # unique name, so two processes rotating at once never clobber each other
+        os.rename(path, f"{path}.{time.time_ns()}{os.getpid() % 1000:03d}")
+    except FileNotFoundError:
+        return
+    for old in rotated_files(path)[:-KEEP_ROTATED or None]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+
+
+class ResultsStore:
+    """Read side: keeps an index of the latest record per (stage, image)."""
+
+    def __init__(self, path=None):
+        self.path = path or STORE_PATH
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._offsets = {}          # inode -> bytes read; follows a file through rotation
+
+    def _refresh(self):
+        """Read only the lines appended since the last call (rotated files first)."""
+        files = rotated_files(self.path) + [self.path]
+        offsets = {}
+        for path in files:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                st = os.fstat(f.fileno())
+                offset = self._offsets.get(st.st_ino, 0)
+                if st.st_size < offset:
+                    offset = 0          # truncated or replaced: read it again
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break           # partially written line, pick it up next time
+                    offset += len(raw)
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        continue
+                    self._latest[(record.get("stage"), record.get("image"))] = record
+                offsets[st.st_ino] = offset
+        if not offsets:
+            self._latest = {}
+        self._offsets = offsets
+
+    def get(self, stage, image):
+        with self._lock:
+            self._refresh()
+            return self._latest.get((stage, image))
+
+    def query(self, stage=None, image=None):
+        """Latest records, optionally filtered by stage and/or image name."""
+        with self._lock:
+            self._refresh()
+            return [
+                r for (s, i), r in self._latest.items()
+                if (stage is None or s == stage) and (image is None or i == image)
+            ]
@@ -5,6 +5,10 @@ let evennessData = null;
 let neatnessData = null;
 let currentView = null;
 
+// rows as served, and the run they belong to, to send back only edited cells
+let original = { evenness: null, neatness: null };
+let runIds = { evenness: null, neatness: null };
+
 const HIDE_KEYWORDS = ["time", "date", "path", "output_image_path"];
 
 // ================= EXECUTE PIPELINE =================
@@ -22,40 +26,29 @@ function executePipeline() {
 
     fetch("/execute", { method: "POST" })
         .then(res => res.json())
+        .then(job => waitForJob(job))
         .then(() => {
             pipelineExecuted = true;
             showStatus("Execution completed.");
 
-            // 🔥 WAIT for both CSV files to be available
-            Promise.all([
-                new Promise(resolve =>
-                    waitForCSV("evenness", csv => resolve({ type: "evenness", csv }))
-                ),
-                new Promise(resolve =>
-                    waitForCSV("neatness", csv => resolve({ type: "neatness", csv }))
-                )
-            ])
-            .then(results => {
-                results.forEach(r => {
-                    if (r.type === "evenness") {
-                        evennessData = parseCSV(r.csv);
-                    }
-                    if (r.type === "neatness") {
-                        neatnessData = parseCSV(r.csv);
-                    }
-                });
-
-                currentView = "evenness";
-                renderFromMemory();
-
-                // Enable interaction buttons AFTER data is ready
-                setButtons({
-                    evenness: true,
-                    neatness: true,
-                    execute: false,   // stay disabled until Home
-                    home: true,
-                    print: true
-                });
+            // results are written by the time the job reports "done"
+            return Promise.all([fetchCSV("evenness"), fetchCSV("neatness")]);
+        })
+        .then(([evenCsv, neatCsv]) => {
+            evennessData = parseCSV(evenCsv);
+            neatnessData = parseCSV(neatCsv);
+            original = { evenness: evennessData, neatness: neatnessData };
+
+            currentView = "evenness";
+            renderFromMemory();
+
+            // Enable interaction buttons AFTER data is ready
+            setButtons({
+                evenness: true,
+                neatness: true,
+                execute: false,   // stay disabled until Home
+                home: true,
+                print: true
             });
         })
         .catch(err => {
@@ -74,19 +67,86 @@ function executePipeline() {
 }
 
 
-function waitForCSV(type, callback) {
-    fetch(`/csv/${type}`)
-        .then(res => {
-            if (res.status === 204) {
-                setTimeout(() => waitForCSV(type, callback), 1000); // ⏳ wait
-                return null;
+// Follow the job's progress stream until it finishes
+function waitForJob(job) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+
+        source.onmessage = e => {
+            const ev = JSON.parse(e.data);
+
+            if (ev.event === "queued") {
+                showStatus(`Queued (position ${ev.position})...`);
+            } else if (ev.event === "progress") {
+                showStatus(formatProgress(ev));
+            } else if (ev.event === "done") {
+                source.close();
+                resolve();
+            } else if (ev.event === "failed") {
+                source.close();
+                reject(new Error("Pipeline failed"));
             }
-            return res.text();
+        };
+
+        source.onerror = () => {
+            // stream dropped: fall back to the status endpoint
+            source.close();
+            pollJob(job.status_url, resolve, reject);
+        };
+    });
+}
+
+
+function pollJob(url, resolve, reject) {
+    fetch(url)
+        .then(res => res.json())
+        .then(s => {
+            if (s.status === "done") return resolve();
+            if (s.status === "failed") return reject(new Error(s.error));
+            if (s.progress) showStatus(formatProgress(s.progress));
+            setTimeout(() => pollJob(url, resolve, reject), 2000);
         })
-        .then(text => {
-            if (!text) return;
-            callback(text);
+        .catch(reject);
+}
+
+
+function formatProgress(ev) {
+    if (!ev.stage) return "Processing...";
+    let msg = `Processing... ${ev.stage}`;
+    if (ev.image) msg += ` – ${ev.image}`;
+    if (ev.total) msg += ` (${ev.done}/${ev.total})`;
+    return msg;
+}
+
+
+function fetchCSV(type) {
+    return fetch(`/csv/${type}`).then(res => {
+        runIds[type] = res.headers.get("X-Run-Id");
+        return res.status === 204 ? "" : res.text();
+    });
+}
+
+
+// Cells changed in the table, as [{image, column, value}]. Rows keep the
+// served order; the table only holds the visible columns.
+function collectEdits(served, edited) {
+    if (!served || !edited || served.length < 2) return [];
+
+    const headers = served[0];
+    const imageIdx = headers.findIndex(h => h === "Image" || h === "Image_Name");
+    if (imageIdx < 0) return [];
+
+    const edits = [];
+    for (let r = 1; r < Math.min(served.length, edited.length); r++) {
+        edited[0].forEach((column, i) => {
+            const j = headers.indexOf(column);
+            if (j < 0 || j === imageIdx) return;
+            if ((served[r][j] || "") !== edited[r][i]) {
+                edits.push({ image: served[r][imageIdx], column, value: edited[r][i] });
+            }
         });
+    }
+    return edits;
 }
 
 
@@ -105,13 +165,15 @@ function goHome() {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
-            evenness: evennessData.map(r => r.join(",")).join("\n"),
-            neatness: neatnessData.map(r => r.join(",")).join("\n")
+            run_id: runIds,
+            evenness: collectEdits(original.evenness, evennessData),
+            neatness: collectEdits(original.neatness, neatnessData)
         })
     })
     .then(() => {
         evennessData = null;
         neatnessData = null;
+        original = { evenness: null, neatness: null };
         currentView = null;
 
         clearTable();
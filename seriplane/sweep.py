@@ -0,0 +1,237 @@
+"""
+Threshold sweep for evenness.
+
+    python cli.py sweep [folder] --v1 3,4,5 --v2 6:10:1 --v3 11,13 --window 3,5,7 --min-cols 4,8
+    python cli.py sweep --from-profiles [--since DAY] [--images PATTERN] ...
+
+Every combination of v1/v2/v3_threshold, window_size and
+min_cols_for_defect is scored over a batch of strips, and the defect
+counts per combination are written to one comparison table. Values are
+comma lists or inclusive start:stop:step ranges; parameters left out
+keep their evenness.py value. Combinations with v1 < v2 < v3 only.
+
+The strips are decoded once (or read from the profile store, see
+profiles.py) to their column sums and histogram. For each strip the
+column means, comparator values and the sliding mean per window_size
+are computed once, then every threshold triple and comparator is
+classified in one broadcast and the regions of the whole grid are
+merged in one pass per min_cols_for_defect.
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import evenness
+import profiles
+from batch import imap_ordered
+
+# ===================== SETTINGS =====================
+OUT_CSV = os.path.join("results", "evenness_sweep.csv")
+SHOW_ROWS = 20              # rows printed, fewest defects first
+# ====================================================
+
+PARAMS = {
+    "v1": "v1_threshold",
+    "v2": "v2_threshold",
+    "v3": "v3_threshold",
+    "window": "window_size",
+    "min_cols": "min_cols_for_defect",
+}
+
+
+def parse_values(spec, cast=float):
+    """ "3,4,5" or "3:6:0.5" (inclusive) -> list of values."""
+    values = []
+    for part in spec.split(","):
+        if ":" in part:
+            start, stop, step = (float(x) for x in part.split(":"))
+            values.extend(np.arange(start, stop + step / 2, step).round(6).tolist())
+        else:
+            values.append(float(part))
+    return sorted({cast(v) for v in values})
+
+
+def threshold_triples(v1s, v2s, v3s):
+    """(n, 3) array of the (v1, v2, v3) combinations with v1 < v2 < v3."""
+    triples = [t for t in itertools.product(v1s, v2s, v3s) if t[0] < t[1] < t[2]]
+    return np.array(triples, dtype=np.float64).reshape(-1, 3)
+
+
+# --------------------------------------------------
+# STRIP PROFILES
+# --------------------------------------------------
+def decode_profile(path):
+    """(name, height, hist, col_sums) of one strip image, or None if unreadable."""
+    # decoded as evenness decodes it: libjpeg's own grey decode differs by
+    # a few levels from BGR -> cvtColor on some pixels
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    return (os.path.basename(path), *evenness.strip_profile(img))
+
+
+def folder_profiles(folder, workers=None):
+    # OpenCV decodes outside the GIL
+    paths = evenness.list_images(folder)
+    return [p for p in imap_ordered(decode_profile, paths, workers, use_threads=True) if p is not None]
+
+
+def stored_profiles(since=None, until=None, pattern=None):
+    strips = []
+    for _, image, path in profiles.iter_profiles(since, until, pattern):
+        height, hist, col_sums = profiles.load(path)
+        # copies, so each file's memory map (and descriptor) is released
+        strips.append((image, height, np.array(hist), np.array(col_sums)))
+    return strips
+
+
+# --------------------------------------------------
+# GRID SCORING
+# --------------------------------------------------
+def grid_codes(abs_dev, triples):
+    """Class code per (comparator, triple, column) for abs deviations of shape (comparators, columns)."""
+    a = abs_dev[:, None, :]
+    v1, v2, v3 = (triples[:, i][None, :, None] for i in range(3))
+    # same as evenness.classify_columns, given v1 < v2 < v3
+    return (a >= v1).astype(np.int8) + (a >= v2) + (a >= v3)
+
+
+def grid_class_counts(codes, min_cols):
+    """
+    evenness.regions_from_codes for every row of codes (rows, columns) at
+    once; returns the (rows, 4) class counts of the merged regions.
+    """
+    rows, n = codes.shape
+    # min_cols zero columns after each row: runs never cross rows and the
+    # gap between rows is always wide enough to start a new merge group
+    padded = np.zeros((rows, n + min_cols), dtype=codes.dtype)
+    padded[:, :n] = codes
+    starts, ends, cls = evenness.run_lengths(padded.ravel())
+
+    keep = (cls > 0) & ((ends - starts + 1) >= min_cols)
+    starts, ends, cls = evenness.merge_close_regions(starts[keep], ends[keep], cls[keep], min_cols)
+
+    row = starts // (n + min_cols)
+    return np.bincount(row * 4 + cls, minlength=rows * 4).reshape(rows, 4)
+
+
+def sweep(strips, triples, windows, min_cols_values, comparators=None):
+    """
+    Defect counts for every combination over the strips, as
+    {(window, min_cols): {"counts": (comparators, triples, 4) class
+    counts summed over strips, "strips": (comparators, triples) strips
+    with any defect}}.
+    """
+    comparators = comparators or evenness.comparators
+    percentiles = [q for q in map(evenness.comparator_percentile, comparators) if q is not None]
+    shape = (len(comparators), len(triples))
+    totals = {
+        key: {"counts": np.zeros((*shape, 4), dtype=np.int64), "strips": np.zeros(shape, dtype=np.int64)}
+        for key in itertools.product(windows, min_cols_values)
+    }
+
+    for _, height, hist, col_sums in strips:
+        num_cols = len(col_sums) // evenness.column_width
+        if num_cols <= 0:
+            continue
+        column_means = evenness.block_means(col_sums, height)
+        brightness = evenness.histogram_stats(hist, percentiles)
+        refs = np.array([evenness.comparator_value(c, brightness) for c in comparators])[:, None]
+
+        for window in windows:
+            local_means = evenness.sliding_mean(column_means, window)
+            deviation = ((local_means[None, :] - refs) / (refs + 1e-8)) * 100
+            codes = grid_codes(np.abs(deviation[:, :num_cols]), triples).reshape(-1, num_cols)
+
+            for min_cols in min_cols_values:
+                counts = grid_class_counts(codes, min_cols).reshape(*shape, 4)
+                t = totals[(window, min_cols)]
+                t["counts"] += counts
+                t["strips"] += counts[..., 1:].sum(axis=-1) > 0
+    return totals
+
+
+def comparison_table(totals, triples, comparators=None):
+    """One row per combination with the defect counts per comparator."""
+    import pandas as pd
+
+    comparators = comparators or evenness.comparators
+    current = (evenness.v1_threshold, evenness.v2_threshold, evenness.v3_threshold,
+               evenness.window_size, evenness.min_cols_for_defect)
+    rows = []
+    for (window, min_cols), t in totals.items():
+        for i, (v1, v2, v3) in enumerate(triples.tolist()):
+            row = {"v1_threshold": v1, "v2_threshold": v2, "v3_threshold": v3,
+                   "window_size": window, "min_cols_for_defect": min_cols}
+            for j, c in enumerate(comparators):
+                label = evenness.comparator_label(c)
+                counts = t["counts"][j, i]
+                row[f"{label}_v1_Count"] = int(counts[1])
+                row[f"{label}_v2_Count"] = int(counts[2])
+                row[f"{label}_v3_Count"] = int(counts[3])
+                row[f"{label}_Total_Defects"] = int(counts[1:].sum())
+                row[f"{label}_Strips_With_Defects"] = int(t["strips"][j, i])
+            row["Current"] = (v1, v2, v3, window, min_cols) == current
+            rows.append(row)
+    return pd.DataFrame(rows).sort_values(list(PARAMS.values()), ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sweep", description="evenness threshold sweep")
+    parser.add_argument("folder", nargs="?", help=f"strip images (default: {evenness.folder_path})")
+    parser.add_argument("--from-profiles", action="store_true", help="use the stored column profiles instead")
+    parser.add_argument("--since", metavar="YYYY-MM-DD")
+    parser.add_argument("--until", metavar="YYYY-MM-DD")
+    parser.add_argument("--images", metavar="PATTERN", help="profile strip names, e.g. '12_*'")
+    for flag, name in PARAMS.items():
+        parser.add_argument(f"--{flag.replace('_', '-')}", dest=flag, metavar="VALUES",
+                            help=f"{name} values (default: {getattr(evenness, name)})")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--out", default=OUT_CSV)
+    args = parser.parse_args(argv)
+
+    def values(flag, cast):
+        spec = getattr(args, flag)
+        return parse_values(spec, cast) if spec else [cast(getattr(evenness, PARAMS[flag]))]
+
+    triples = threshold_triples(values("v1", float), values("v2", float), values("v3", float))
+    windows, min_cols_values = values("window", int), values("min_cols", int)
+    if len(triples) == 0:
+        parser.error("no v1 < v2 < v3 combination in the grid")
+    if min(min_cols_values) < 1:
+        # grid_class_counts separates the strips with min_cols blank columns
+        parser.error("--min-cols values must be at least 1")
+
+    t0 = time.perf_counter()
+    if args.from_profiles:
+        strips = stored_profiles(args.since, args.until, args.images)
+    else:
+        strips = folder_profiles(args.folder or evenness.folder_path, args.workers)
+    if not strips:
+        print("No strips to sweep over.")
+        return 1
+    t1 = time.perf_counter()
+
+    totals = sweep(strips, triples, windows, min_cols_values)
+    table = comparison_table(totals, triples)
+    t2 = time.perf_counter()
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    table.to_csv(args.out, index=False)
+
+    label = evenness.comparator_label(evenness.comparators[0])
+    show = table.sort_values(f"{label}_Total_Defects", kind="stable").head(SHOW_ROWS)
+    print(show.to_string(index=False))
+    print(f"\n{len(table)} combination(s) x {len(strips)} strip(s): "
+          f"load {t1 - t0:.2f}s, sweep {t2 - t1:.2f}s")
+    print(f"Table saved to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
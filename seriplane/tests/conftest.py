@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# the seriplane modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """
+    Empty working folder (data/, results/, ...) for a pipeline run, with
+    the stub detector standing in for YOLO.
+    """
+    import bench
+    import history
+    import neatness
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "models").mkdir()
+    (tmp_path / "models" / "best.pt").write_bytes(b"stub")
+
+    monkeypatch.setattr(neatness, "INFERENCE_BACKEND", bench.StubDetector)
+    monkeypatch.setattr(neatness, "MODEL_PATH", str(tmp_path / "models" / "best.pt"))
+    monkeypatch.setattr(neatness, "INPUT_DIR", str(tmp_path / "preprocessed"))
+    monkeypatch.setattr(neatness, "OUTPUT_DIR", str(tmp_path / "results" / "neatness"))
+    monkeypatch.setattr(history, "HISTORY_DB", str(tmp_path / "results" / "history.db"))
+    return tmp_path
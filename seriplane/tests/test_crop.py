@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import bench
+import crop
+
+
+def bench_planes(n=40, seed=1):
+    """Random bench.make_plane_image planes: size, strip count / height and noise vary."""
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        yield bench.make_plane_image(
+            int(rng.integers(300, 2000)), int(rng.integers(300, 2000)),
+            n_strips=int(rng.integers(1, 4)), strip_frac=float(rng.uniform(0.1, 0.3)),
+            noise=float(rng.uniform(2, 40)), seed=i,
+        )
+
+
+@pytest.mark.parametrize("step", [2, 4, 8])
+def test_fast_bands_match_full_profile(step):
+    for img in bench_planes():
+        assert crop.detect_bands_fast(img, step) == crop.detect_bands(img)
+
+
+def test_fast_detect_falls_back_on_wrong_bands(monkeypatch):
+    img = bench.make_plane_image(1200, 900)
+    expected = [name for name, _ in crop.crop_strips(img, "1.jpeg")]
+
+    monkeypatch.setattr(crop, "fast_detect", True)
+    for wrong in ([], [(10, 12, 3), (300, 500, 201)], [(100, 800, 701)]):
+        monkeypatch.setattr(crop, "detect_bands_fast", lambda img_bgr, wrong=wrong: wrong)
+        assert [name for name, _ in crop.crop_strips(img, "1.jpeg")] == expected
@@ -0,0 +1,41 @@
+import shutil
+
+import cv2
+import pandas as pd
+
+import bench
+import engine
+import evenness
+import history
+import neatness
+
+
+def test_same_content_under_another_name(workspace):
+    cv2.imwrite("data/1.jpeg", bench.make_plane_image(800, 600))
+    shutil.copyfile("data/1.jpeg", "data/3.jpeg")
+
+    engine.PipelineEngine().run()
+
+    even = pd.read_csv(evenness.output_csv)
+    neat = pd.read_csv(neatness.CSV_LOG)
+    expected = ["1_1.jpeg", "1_2.jpeg", "3_1.jpeg", "3_2.jpeg"]
+    assert sorted(even["Image"]) == expected
+    assert sorted(neat["Image_Name"]) == expected
+    assert sorted(r["Image"] for r in history.get_history().query("evenness")) == expected
+
+    # same content: same results under both names
+    by_name = even.set_index("Image")
+    assert by_name.loc["3_1.jpeg"].equals(by_name.loc["1_1.jpeg"])
+
+
+def test_render_on_demand_after_a_run(workspace):
+    import render
+    import results_store
+
+    cv2.imwrite("data/1.jpeg", bench.make_plane_image(800, 600))
+    engine.PipelineEngine().run()
+    shutil.rmtree("preprocessed", ignore_errors=True)     # what Home clears
+
+    store = results_store.ResultsStore()
+    assert render.render("evenness", "1_1.jpeg", store=store) is not None
+    assert render.render("neatness", "1_2.jpeg", store=store) is not None
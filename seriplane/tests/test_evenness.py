@@ -0,0 +1,191 @@
+"""
+The vectorized evenness core must match the original per-column loops
+bit for bit. The reference functions below are those loops, unchanged.
+"""
+import numpy as np
+import pytest
+
+import evenness
+
+
+# --------------------------------------------------
+# REFERENCE (pre-vectorization loops)
+# --------------------------------------------------
+def ref_column_means(gray, column_width):
+    h, w = gray.shape
+    num_cols = w // column_width
+    column_means = []
+    for i in range(num_cols):
+        start = i * column_width
+        end = min((i + 1) * column_width, w)
+        block = gray[:, start:end]
+        column_means.append(np.mean(block))
+    return np.array(column_means)
+
+
+def ref_local_means(column_means, window_size):
+    num_cols = len(column_means)
+    half_w = window_size // 2
+    local_means = []
+    for i in range(num_cols):
+        s = max(0, i - half_w)
+        e = min(num_cols, i + half_w + 1)
+        local_means.append(np.mean(column_means[s:e]))
+    return np.array(local_means)
+
+
+def ref_regions(local_means, comparator_value, num_cols, min_cols):
+    eps = 1e-8
+    deviation_percent = ((local_means - comparator_value) / (comparator_value + eps)) * 100
+
+    column_classes = [evenness.classify(dev) for dev in deviation_percent]
+
+    regions = []
+    start = None
+    current_class = None
+    for i in range(num_cols):
+        c = column_classes[i]
+        if c != current_class:
+            if current_class is not None:
+                regions.append((start, i - 1, current_class))
+            start = i if c is not None else None
+            current_class = c
+    if current_class is not None:
+        regions.append((start, num_cols - 1, current_class))
+
+    filtered_regions = [
+        (start, end, cls)
+        for start, end, cls in regions
+        if (end - start + 1) >= min_cols
+    ]
+
+    final_classes = [None] * num_cols
+    for start, end, cls in filtered_regions:
+        for i in range(start, end + 1):
+            if final_classes[i] is None or evenness.priority[cls] > evenness.priority.get(final_classes[i], 0):
+                final_classes[i] = cls
+
+    final_regions = []
+    start = None
+    current_class = None
+    for i in range(num_cols):
+        c = final_classes[i]
+        if c != current_class:
+            if current_class is not None:
+                final_regions.append((start, i - 1, current_class))
+            start = i if c is not None else None
+            current_class = c
+    if current_class is not None:
+        final_regions.append((start, num_cols - 1, current_class))
+
+    merged_regions = []
+    i = 0
+    while i < len(final_regions):
+        start1, end1, cls1 = final_regions[i]
+        width1 = end1 - start1 + 1
+
+        j = i + 1
+        while j < len(final_regions):
+            start2, end2, cls2 = final_regions[j]
+            width2 = end2 - start2 + 1
+            gap = start2 - end1 - 1
+
+            if gap < min_cols:
+                chosen_class = cls1 if width1 >= width2 else cls2
+                end1 = end2
+                cls1 = chosen_class
+                width1 = end1 - start1 + 1
+                j += 1
+            else:
+                break
+
+        merged_regions.append((start1, end1, cls1))
+        i = j
+
+    class_counts = {'v1': 0, 'v2': 0, 'v3': 0}
+    for _, _, cls in merged_regions:
+        if cls is not None:
+            class_counts[cls] += 1
+
+    return merged_regions, class_counts, deviation_percent
+
+
+# --------------------------------------------------
+# RANDOM STRIPS
+# --------------------------------------------------
+def random_strip(rng):
+    """uint8 strip with a drifting brightness, so every class shows up."""
+    h = int(rng.integers(1, 40))
+    w = int(rng.integers(0, 120)) * evenness.column_width + int(rng.integers(0, evenness.column_width))
+    drift = np.cumsum(rng.normal(0, 6, size=max(w, 1)))[:w]
+    base = rng.uniform(60, 200) + drift
+    noise = rng.normal(0, rng.uniform(0, 30), size=(h, w))
+    return np.clip(base[None, :] + noise, 0, 255).astype(np.uint8)
+
+
+SEEDS = range(300)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_column_profile_and_sliding_mean(seed):
+    rng = np.random.default_rng(seed)
+    gray = random_strip(rng)
+    window = int(rng.integers(1, 10))
+
+    column_means = evenness.column_profile(gray)
+    assert np.array_equal(column_means, ref_column_means(gray, evenness.column_width))
+    assert np.array_equal(evenness.sliding_mean(column_means, window),
+                          ref_local_means(column_means, window))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_regions_match_reference(seed):
+    rng = np.random.default_rng(seed)
+    gray = random_strip(rng)
+    min_cols = int(rng.integers(1, 12))
+
+    local_means = evenness.sliding_mean(evenness.column_profile(gray), int(rng.integers(1, 10)))
+    num_cols = len(local_means)
+    brightness = evenness.brightness_stats(gray)
+
+    for ref in (brightness["mean"], brightness["mode"], float(rng.uniform(40, 220))):
+        want = ref_regions(local_means, ref, num_cols, min_cols)
+        got = evenness.compute_regions_from_comparator(local_means, ref, num_cols, min_cols)
+        assert got[0] == want[0]
+        assert got[1] == want[1]
+        assert np.array_equal(got[2], want[2])
+
+        multi = evenness.compute_regions_multi(local_means, {"c": ref}, num_cols, min_cols)["c"]
+        assert multi[0] == want[0]
+        assert multi[1] == want[1]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_merge_close_regions_matches_greedy_loop(seed):
+    # arbitrary region lists, not only those produced by real profiles
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(0, 30))
+    min_cols = int(rng.integers(1, 10))
+    widths = rng.integers(1, 20, size=n)
+    gaps = rng.integers(0, 2 * min_cols + 1, size=n)
+    starts = np.cumsum(gaps + np.concatenate(([0], widths[:-1])))
+    ends = starts + widths - 1
+    cls = rng.integers(1, 4, size=n)
+
+    expected = []
+    i = 0
+    while i < n:
+        start1, end1, cls1 = int(starts[i]), int(ends[i]), int(cls[i])
+        width1 = end1 - start1 + 1
+        j = i + 1
+        while j < n and starts[j] - end1 - 1 < min_cols:
+            width2 = int(ends[j] - starts[j] + 1)
+            cls1 = cls1 if width1 >= width2 else int(cls[j])
+            end1 = int(ends[j])
+            width1 = end1 - start1 + 1
+            j += 1
+        expected.append((start1, end1, cls1))
+        i = j
+
+    s, e, c = evenness.merge_close_regions(starts, ends, cls, min_cols)
+    assert list(zip(s.tolist(), e.tolist(), c.tolist())) == expected
@@ -0,0 +1,19 @@
+import metrics
+from batch import imap_ordered
+
+
+def timed_square(x):
+    with metrics.stage("test.square", image=f"{x}.jpg"):
+        return x * x
+
+
+def test_worker_process_stages_reach_the_parent_run(tmp_path):
+    metrics.start_run("test")
+    try:
+        assert list(imap_ordered(timed_square, range(6), workers=2)) == [0, 1, 4, 9, 16, 25]
+        records = [r for r in metrics._run["records"] if r["stage"] == "test.square"]
+    finally:
+        metrics.finish_run(str(tmp_path))
+
+    assert sorted(r["image"] for r in records) == [f"{x}.jpg" for x in range(6)]
+    assert metrics._stages["test.square"]["count"] >= 6
@@ -0,0 +1,24 @@
+import os
+
+import results_store
+
+
+def test_store_is_rotated_and_capped(tmp_path, monkeypatch):
+    path = str(tmp_path / "regions.jsonl")
+    monkeypatch.setattr(results_store, "MAX_BYTES", 2000)
+    monkeypatch.setattr(results_store, "KEEP_ROTATED", 2)
+
+    store = results_store.ResultsStore(path)
+    for i in range(500):
+        results_store.append({"stage": "evenness", "image": f"{i % 10}.jpg", "n": i}, path)
+        if i % 37 == 0:
+            store.query()
+
+    assert len(results_store.rotated_files(path)) == 2
+    total = sum(os.path.getsize(p) for p in results_store.rotated_files(path) + [path])
+    assert total <= 3 * (2000 + 200)
+
+    # the reader that followed along and a fresh one agree on the latest records
+    latest = {r["image"]: r["n"] for r in store.query()}
+    assert latest == {f"{i}.jpg": 490 + i for i in range(10)}
+    assert {r["image"]: r["n"] for r in results_store.ResultsStore(path).query()} == latest
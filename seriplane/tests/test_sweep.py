@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+import pytest
+
+import evenness
+import sweep
+
+
+@pytest.fixture
+def strip_folder(tmp_path):
+    """Colour JPEG strips with uneven column brightness."""
+    rng = np.random.default_rng(0)
+    for i in range(6):
+        w = 1100
+        base = 120 + np.cumsum(rng.normal(0, 3, w))
+        img = np.clip(base[None, :, None] * rng.uniform(0.6, 1.2, 3) + rng.normal(0, 20, (60, w, 3)), 0, 255)
+        cv2.imwrite(str(tmp_path / f"{i}_1.jpeg"), img.astype(np.uint8))
+    return tmp_path
+
+
+def test_sweep_matches_evenness(strip_folder):
+    strips = sweep.folder_profiles(str(strip_folder), workers=1)
+    triples = sweep.threshold_triples([3, 4, 5], [6, 8], [10, 12])
+    windows, min_cols_values = [3, 5], [1, 4, 8]
+    totals = sweep.sweep(strips, triples, windows, min_cols_values)
+
+    for window in windows:
+        for min_cols in min_cols_values:
+            for i, (v1, v2, v3) in enumerate(triples.tolist()):
+                settings = dict(v1_threshold=v1, v2_threshold=v2, v3_threshold=v3,
+                                window_size=window, min_cols_for_defect=min_cols)
+                expected = np.zeros((len(evenness.comparators), 4), dtype=np.int64)
+                with pytest.MonkeyPatch.context() as mp:
+                    for name, value in settings.items():
+                        mp.setattr(evenness, name, value)
+                    for path in sorted(strip_folder.iterdir()):
+                        height, hist, col_sums = evenness.strip_profile(cv2.imread(str(path)))
+                        _, results = evenness.analyse_profile(col_sums, height, hist)
+                        for j, c in enumerate(evenness.comparators):
+                            counts = results[c][1]
+                            expected[j, 1:] += [counts["v1"], counts["v2"], counts["v3"]]
+                got = totals[(window, min_cols)]["counts"][:, i]
+                assert np.array_equal(got[:, 1:], expected[:, 1:])
+
+
+def test_min_cols_below_one_is_rejected():
+    with pytest.raises(SystemExit):
+        sweep.main(["--min-cols", "0,4"])
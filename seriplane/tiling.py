@@ -0,0 +1,92 @@
+"""
+Tiling helpers for running the detector on tall strips.
+
+A strip is cut into overlapping tiles close to the model's input size, so
+nothing gets letterboxed down. The boxes found in each tile are shifted back
+to strip coordinates, and duplicates from the overlaps are removed with
+class-wise NMS.
+"""
+import numpy as np
+
+
+def tile_starts(length, tile, overlap):
+    """Start offsets of tiles of size `tile` covering [0, length) with at least `overlap` px shared."""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_grid(shape, tile, overlap):
+    """(x0, y0, x1, y1) tiles covering an image of shape (H, W, ...)."""
+    h, w = shape[:2]
+    return [
+        (x0, y0, min(x0 + tile, w), min(y0 + tile, h))
+        for y0 in tile_starts(h, tile, overlap)
+        for x0 in tile_starts(w, tile, overlap)
+    ]
+
+
+def overlap_matrix(box, boxes, metric="iou"):
+    """Overlap of one xyxy box with each row of boxes: IoU, or intersection over the smaller area ("ios")."""
+    ix1 = np.maximum(box[0], boxes[:, 0])
+    iy1 = np.maximum(box[1], boxes[:, 1])
+    ix2 = np.minimum(box[2], boxes[:, 2])
+    iy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "ios":
+        denom = np.minimum(area, areas)
+    else:
+        denom = area + areas - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def nms(boxes, scores, classes, threshold=0.5, metric="iou"):
+    """
+    Indices of the boxes kept by greedy per-class NMS, best score first.
+    Ties go to the larger box, so a box cut off at a tile edge loses to
+    the complete one from the neighbouring tile.
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    for cls in np.unique(classes):
+        idx = np.flatnonzero(classes == cls)
+        idx = idx[np.lexsort((-areas[idx], -scores[idx]))]
+        while len(idx):
+            best = idx[0]
+            keep.append(best)
+            if len(idx) == 1:
+                break
+            rest = idx[1:]
+            idx = rest[overlap_matrix(boxes[best], boxes[rest], metric) < threshold]
+    keep = np.asarray(keep, dtype=np.int64)
+    return keep[np.argsort(-scores[keep], kind="stable")]
+
+
+def merge_detections(parts, threshold=0.5, metric="iou"):
+    """
+    Merge per-tile detections, given as (det, x0, y0) with det in the
+    model_server.detections_from_result format, into one det for the strip.
+    """
+    names = {}
+    boxes, scores, classes = [], [], []
+    for det, x0, y0 in parts:
+        names.update(det["names"])
+        boxes.append(det["boxes"] + np.array([x0, y0, x0, y0], dtype=np.float32))
+        scores.append(det["confidences"])
+        classes.append(det["classes"])
+
+    if not boxes:
+        return {"boxes": np.zeros((0, 4), np.float32), "confidences": np.zeros(0, np.float32),
+                "classes": np.zeros(0, np.int64), "names": names}
+
+    boxes = np.concatenate(boxes).astype(np.float32)
+    scores = np.concatenate(scores).astype(np.float32)
+    classes = np.concatenate(classes).astype(np.int64)
+    keep = nms(boxes, scores, classes, threshold, metric)
+    return {"boxes": boxes[keep], "confidences": scores[keep], "classes": classes[keep], "names": names}
@@ -0,0 +1,158 @@
+"""
+Watch-folder mode.
+
+Polls the raw image folder and pushes every new image through
+precrop -> crop -> evenness -> neatness as soon as it has finished
+landing, appending its rows to the result CSVs. A file counts as landed
+once its size and mtime have not changed for DEBOUNCE_S seconds. Finished
+images are remembered in STATE_FILE by name, size and mtime, so restarts
+never reprocess them, while a new plane saved under a name already used
+(1.jpeg, 2.jpeg, ...) is picked up again.
+
+Usage:  python watcher.py [folder]
+"""
+import json
+import os
+import sys
+import time
+
+import precrop
+import evenness
+import history
+import metrics
+import neatness
+from engine import PipelineEngine
+
+# ===================== SETTINGS =====================
+WATCH_DIR = precrop.INPUT_DIR
+POLL_S = 1.0                 # how often the folder is listed
+DEBOUNCE_S = 2.0             # size/mtime must be stable this long
+STATE_FILE = os.path.join("results", "watch_state.json")
+# ====================================================
+
+
+def append_rows(csv_path, rows):
+    """Append rows to csv_path, keeping the column order of an existing file."""
+    if not rows:
+        return
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+        columns = pd.read_csv(csv_path, nrows=0).columns
+        df.reindex(columns=columns).to_csv(csv_path, mode="a", header=False, index=False)
+    else:
+        os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+        df.to_csv(csv_path, index=False)
+
+
+class FolderWatcher:
+    """Tracks which images are stable and which have already been processed."""
+
+    def __init__(self, folder=WATCH_DIR, state_file=STATE_FILE, debounce_s=DEBOUNCE_S):
+        self.folder = folder
+        self.state_file = state_file
+        self.debounce_s = debounce_s
+        self.done = self._load_state()
+        self._seen = {}          # name -> (size, mtime_ns, first time seen unchanged)
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.done, f, indent=1)
+        os.replace(tmp, self.state_file)
+
+    def is_done(self, name, sig):
+        """Whether this version (size, mtime_ns) of name was already processed."""
+        entry = self.done.get(name)
+        if entry is None:
+            return False
+        if "size" in entry:
+            return (entry["size"], entry["mtime_ns"]) == sig
+        # state written before the size/mtime were kept: done unless the
+        # file was written after it was processed
+        done_at = time.mktime(time.strptime(entry["at"], "%Y-%m-%d %H:%M:%S"))
+        return sig[1] / 1e9 <= done_at + 1
+
+    def ready_images(self):
+        """Paths of unprocessed images whose size/mtime have settled."""
+        now = time.monotonic()
+        ready = []
+        names = [f for f in sorted(os.listdir(self.folder))
+                 if f.lower().endswith(precrop.VALID_EXTS)]
+
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if self.is_done(name, sig):
+                continue
+
+            prev = self._seen.get(name)
+            if prev is None or prev[:2] != sig:
+                self._seen[name] = (*sig, now)
+            elif now - prev[2] >= self.debounce_s:
+                ready.append(os.path.join(self.folder, name))
+
+        # forget files that disappeared before settling
+        for name in set(self._seen) - set(names):
+            del self._seen[name]
+        return ready
+
+    def mark_done(self, path, status="ok"):
+        name = os.path.basename(path)
+        seen = self._seen.pop(name, None)
+        if seen is None:
+            try:
+                st = os.stat(path)
+                seen = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                seen = (None, None)
+        self.done[name] = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "status": status,
+                           "size": seen[0], "mtime_ns": seen[1]}
+        self._save_state()
+
+
+def run(folder=WATCH_DIR, poll_s=POLL_S):
+    engine = PipelineEngine()
+    watcher = FolderWatcher(folder)
+    print(f"👀 Watching {folder} (Ctrl+C to stop)")
+
+    while True:
+        for path in watcher.ready_images():
+            t0 = time.perf_counter()
+            try:
+                even_rows, neat_rows = engine.process_image(path)
+            except Exception as e:
+                # recorded as failed so a broken file is not retried forever
+                print(f"❌ {os.path.basename(path)}: {e}")
+                watcher.mark_done(path, status=f"failed: {e}")
+                continue
+
+            append_rows(evenness.output_csv, even_rows)
+            append_rows(neatness.CSV_LOG, neat_rows)
+            # every image is its own run, so /csv (latest run) shows the
+            # plane that just landed and Home's edits only touch its rows
+            run_id = metrics.new_run_id()
+            history.append("evenness", even_rows, run_id)
+            history.append("neatness", neat_rows, run_id)
+            watcher.mark_done(path)
+            print(f"✅ {os.path.basename(path)}: {len(even_rows)} strip(s) "
+                  f"in {time.perf_counter() - t0:.2f}s")
+        time.sleep(poll_s)
+
+
+if __name__ == "__main__":
+    try:
+        run(sys.argv[1] if len(sys.argv) > 1 else WATCH_DIR)
+    except KeyboardInterrupt:
+        print("\nStopped.")
@@ -1,54 +1,66 @@
 import os
+import sys
+import base64
 import cv2
 import numpy as np
-import pandas as pd
-from flask import Flask, request, jsonify
-from ultralytics import YOLO
+from flask import Flask, request, jsonify, send_file, Response
 from collections import defaultdict
 from datetime import datetime
 from flask_cors import CORS
 from flask import render_template
 
+# shared inference service lives next to the seriplane stages
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "seriplane"))
+from model_server import ModelServer, ServerBusy, detections_from_result
+import metrics
+from request_log import RequestLog
+from artifacts import ArtifactStore, new_id
+
 app = Flask(__name__)
 CORS(app) 
-# Load YOLOv8 model
+# Load YOLOv8 model once, warm it up, and batch overlapping /predict calls
 MODEL_PATH = "bestt.pt"
-model = YOLO(MODEL_PATH)
-
-# Ensure output directory exists
+MAX_BATCH_SIZE = 4
+MAX_WAIT_MS = 15
+MODEL_WORKERS = 1               # model copies serving the queue
+MAX_QUEUE = 16                  # images waiting for inference; beyond this /predict answers 429
+BACKEND = "ultralytics"         # or "onnxruntime" / "openvino": CPU inference on an ONNX export
+model_server = ModelServer(MODEL_PATH, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                           max_queue=MAX_QUEUE, workers=MODEL_WORKERS, backend=BACKEND)
+metrics.gauge("inference_queue", model_server.queued)
+
+# Per-request images: static/output/<request id>/{input,result}.jpg,
+# recent ones also kept in memory; old folders are cleaned up in the background
 OUTPUT_DIR = "static/output"
-INPUT_DIR = "static/input"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(INPUT_DIR, exist_ok=True)
+SAVE_INPUT = True               # keep the uploaded image for the UI
+INLINE_IMAGES = False           # True (or ?inline=1) = base64 images in the JSON
+artifacts = ArtifactStore(OUTPUT_DIR)
 
-# Log file
+# Request log: rows are appended to LOG_DB by a background writer;
+# LOG_FILE (Excel) is only written on demand via /logs/export
+LOG_DB = "logs.db"
 LOG_FILE = "logs.xlsx"
 
 # Class categories
 CLEANLINESS_CLASSES = {"minor", "major", "supermajor"}
 NEATNESS_CLASSES = {"neatness"}
 
+# an existing logs.xlsx is imported once when the database is created
+request_log = RequestLog(LOG_DB, import_excel=LOG_FILE)
+
 
-def log_to_excel(timestamp, image_name, cleanliness, neatness, total):
-    # Flatten counts into one dict
+def log_prediction(timestamp, image_name, cleanliness, neatness, total):
+    # Flatten counts into one row (same columns as the old Excel log)
     log_entry = {
         "Timestamp": timestamp,
         "Image Name": image_name,
-        **{f"Cleanliness - {k}": cleanliness.get(k, 0) for k in CLEANLINESS_CLASSES},
-        **{f"Neatness - {k}": neatness.get(k, 0) for k in NEATNESS_CLASSES},
+        **{f"Cleanliness - {k}": cleanliness.get(k, 0) for k in sorted(CLEANLINESS_CLASSES)},
+        **{f"Neatness - {k}": neatness.get(k, 0) for k in sorted(NEATNESS_CLASSES)},
         "Total Defects": total
     }
 
-    # Append or create Excel
-    df_new = pd.DataFrame([log_entry])
-
-    if os.path.exists(LOG_FILE):
-        df_existing = pd.read_excel(LOG_FILE)
-        df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-    else:
-        df_combined = df_new
-
-    df_combined.to_excel(LOG_FILE, index=False)
+    # queued; written in batches by the log thread
+    request_log.log(log_entry)
 
 
 # @app.route('/')
@@ -59,6 +71,62 @@ def log_to_excel(timestamp, image_name, cleanliness, neatness, total):
 def index():
     return render_template("index.html") 
 
+def decode_image(raw):
+    """BGR image from uploaded bytes, or None if they are not an image."""
+    return cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+
+
+def summarize(img, result, inline=False):
+    """Store the images, count and log the defects; returns the JSON response."""
+    # every request gets its own artifact folder
+    request_id = new_id()
+    filename = f"{request_id}/result.jpg"
+    with metrics.stage("predict.plot"):
+        annotated_img = result.plot()
+
+    # Save input + annotated image
+    images = {"output_image": ("result.jpg", annotated_img)}
+    if SAVE_INPUT:
+        images["input_image"] = ("input.jpg", img)
+    image_refs = {"input_image": None}         # null when the input is not kept
+    for key, (name, image) in images.items():
+        with metrics.stage("predict.save"):
+            data = artifacts.put(request_id, name, image)
+        image_refs[key] = ("data:image/jpeg;base64," + base64.b64encode(data).decode()
+                           if inline else artifacts.url(request_id, name))
+
+    # Count defects
+    defect_counts = defaultdict(int)
+    total_defects = 0
+    det = detections_from_result(result)
+    if len(det["classes"]):
+        names = det["names"]
+        for cls_id in det["classes"]:
+            cls_name = names[int(cls_id)]
+            defect_counts[cls_name] += 1
+            total_defects += 1
+
+    # Organize counts
+    cleanliness = {cls: defect_counts.get(cls, 0) for cls in CLEANLINESS_CLASSES}
+    neatness = {cls: defect_counts.get(cls, 0) for cls in NEATNESS_CLASSES}
+
+    # Log the request
+    log_prediction(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), filename, cleanliness, neatness, total_defects)
+
+    # JSON response
+    return {
+        "Cleanliness": cleanliness,
+        "Neatness": neatness,
+        "Total": total_defects,
+        "request_id": request_id,
+        **image_refs,
+    }
+
+
+BUSY_RESPONSE = {"error": "Server busy, retry shortly"}
+BUSY_HEADERS = {"Retry-After": "1"}
+
+
 @app.route('/predict', methods=['POST'])
 def predict():
     if 'image' not in request.files:
@@ -70,56 +138,53 @@ def predict():
 
     try:
         # Read image
-        file_bytes = np.frombuffer(file.read(), np.uint8)
-        img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+        with metrics.stage("predict.decode"):
+            img = decode_image(file.read())
         if img is None:
+            metrics.count("predict_requests", status="invalid")
             return jsonify({"error": "Invalid image"}), 400
 
-        # filename = os.path.basename(file.filename)
-        filename = "result.jpg" 
-
-        # Run inference
-        results = model(img)
-        annotated_img = results[0].plot()
-
-        # Save annotated image
-        input_filename = "input.jpg"
-        input_path = os.path.join(INPUT_DIR, input_filename)
-        cv2.imwrite(input_path, img)
-
-        output_path = os.path.join(OUTPUT_DIR, filename)
-        cv2.imwrite(output_path, annotated_img)
-
-        # Count defects
-        defect_counts = defaultdict(int)
-        total_defects = 0
-        if results[0].boxes:
-            names = results[0].names
-            for cls_id in results[0].boxes.cls.cpu().numpy():
-                cls_name = names[int(cls_id)]
-                defect_counts[cls_name] += 1
-                total_defects += 1
-
-        # Organize counts
-        cleanliness = {cls: defect_counts.get(cls, 0) for cls in CLEANLINESS_CLASSES}
-        neatness = {cls: defect_counts.get(cls, 0) for cls in NEATNESS_CLASSES}
-
-        # Log to Excel
-        log_to_excel(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), filename, cleanliness, neatness, total_defects)
-
-        # JSON response
-        response = {
-            "Cleanliness": cleanliness,
-            "Neatness": neatness,
-            "Total": total_defects,
-            "output_image": output_path
-        }
-
+        # Run inference (grouped with concurrent requests); full queue = 429
+        try:
+            future = model_server.submit(img, block=False)
+        except ServerBusy:
+            metrics.count("predict_requests", status="busy")
+            return jsonify(BUSY_RESPONSE), 429, BUSY_HEADERS
+        with metrics.stage("predict.infer"):
+            result = future.result()
+
+        inline = INLINE_IMAGES or request.args.get("inline") == "1"
+        response = summarize(img, result, inline)
+        metrics.count("predict_requests", status="ok")
         return jsonify(response), 200
 
     except Exception as e:
+        metrics.count("predict_requests", status="error")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/artifacts/<request_id>/<name>')
+def get_artifact(request_id, name):
+    data = artifacts.get(request_id, name)
+    if data is None:
+        return jsonify({"error": "Not found"}), 404
+    return Response(data, mimetype="image/jpeg",
+                    headers={"Cache-Control": "private, max-age=3600"})
+
+
+@app.route('/logs/export')
+def export_logs():
+    """Excel copy of the request log (optionally ?since=YYYY-MM-DD)."""
+    path = request_log.export_excel(LOG_FILE, since=request.args.get("since"))
+    return send_file(os.path.abspath(path), as_attachment=True,
+                     download_name=os.path.basename(LOG_FILE))
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Request counts, per-stage timings and queue depth for Prometheus."""
+    return Response(metrics.render_prometheus(prefix="yolo"), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001,debug=True)
+    app.run(host='0.0.0.0', port=5001, debug=True, threaded=True)
@@ -0,0 +1,117 @@
+"""
+Per-request image artifacts for /predict.
+
+Every request gets its own id, and its input / annotated images are kept
+under ARTIFACT_DIR/<id>/ instead of one shared input.jpg / result.jpg, so
+concurrent requests (threads or worker processes) never overwrite each
+other. The most recent images are also held encoded in memory (LRU) and
+served from there; a background thread deletes folders older than TTL_S.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+
+# ===================== SETTINGS =====================
+ARTIFACT_DIR = "static/output"
+MEMORY_ITEMS = 64               # encoded images kept in memory (0 = off)
+WRITE_FILES = True              # False = memory only (single process)
+TTL_S = 3600                    # request folders older than this are removed
+CLEANUP_INTERVAL_S = 300
+JPEG_QUALITY = 95               # cv2.imwrite default
+# ====================================================
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACT_DIR, memory_items=MEMORY_ITEMS, write_files=WRITE_FILES,
+                 ttl_s=TTL_S, cleanup_interval_s=CLEANUP_INTERVAL_S):
+        self.root = root
+        self.memory_items = memory_items
+        self.write_files = write_files
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()        # (request_id, name) -> jpeg bytes
+        os.makedirs(root, exist_ok=True)
+
+        if ttl_s and cleanup_interval_s:
+            threading.Thread(target=self._cleanup_loop, args=(cleanup_interval_s,),
+                             name="artifact-cleanup", daemon=True).start()
+
+    # ---------------- public API ----------------
+    def put(self, request_id, name, img):
+        """Encode img as JPEG once, keep it; returns the encoded bytes."""
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            raise ValueError(f"Could not encode {name}")
+        data = buf.tobytes()
+
+        if self.write_files:
+            folder = os.path.join(self.root, request_id)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, name)
+            tmp = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        if self.memory_items:
+            with self._lock:
+                self._memory[(request_id, name)] = data
+                self._memory.move_to_end((request_id, name))
+                while len(self._memory) > self.memory_items:
+                    self._memory.popitem(last=False)
+        return data
+
+    def get(self, request_id, name):
+        """JPEG bytes of a stored artifact, or None if unknown / expired."""
+        with self._lock:
+            data = self._memory.get((request_id, name))
+            if data is not None:
+                self._memory.move_to_end((request_id, name))
+                return data
+        if not self.write_files or not _safe(request_id) or not _safe(name):
+            return None
+        try:
+            with open(os.path.join(self.root, request_id, name), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def url(request_id, name):
+        return f"/artifacts/{request_id}/{name}"
+
+    def cleanup(self):
+        """Remove request folders older than ttl_s; returns how many."""
+        cutoff = time.time() - self.ttl_s
+        removed = 0
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    # ---------------- internals ----------------
+    def _cleanup_loop(self, interval_s):
+        while True:
+            time.sleep(interval_s)
+            try:
+                self.cleanup()
+            except OSError as e:
+                print(f"[WARN] artifact cleanup: {e}")
+
+
+def _safe(part):
+    """Reject path components that could leave the artifact folder."""
+    return bool(part) and part not in (".", "..") and "/" not in part and "\\" not in part
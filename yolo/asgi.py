@@ -0,0 +1,79 @@
+"""
+Async (ASGI) serving mode for the YOLO service.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+/predict runs on the event loop. Uploads from many stations are received
+concurrently, and decoding plus result encoding run in the thread pool.
+Inference goes through the bounded model_server queue, which a fixed
+pool of MODEL_WORKERS serves. When the queue is full the request gets a
+429 immediately instead of waiting behind the burst. Every other route
+(/, /artifacts, /logs/export, /metrics) is the Flask app from app.py, mounted as
+WSGI.
+
+Needs starlette, python-multipart and an ASGI server such as uvicorn.
+"""
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:             # older setups: starlette's own (deprecated) adapter
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import app as service
+import metrics
+from model_server import ServerBusy
+
+
+async def predict(request):
+    form = await request.form()
+    try:
+        file = form.get("image")
+        if file is None or isinstance(file, str):
+            return JSONResponse({"error": "No image part in the request"}, status_code=400)
+        if not file.filename:
+            return JSONResponse({"error": "No selected file"}, status_code=400)
+
+        # Read + decode image off the event loop
+        raw = await file.read()
+        with metrics.stage("predict.decode"):
+            img = await run_in_threadpool(service.decode_image, raw)
+        if img is None:
+            metrics.count("predict_requests", status="invalid")
+            return JSONResponse({"error": "Invalid image"}, status_code=400)
+
+        # Run inference through the bounded queue; full queue = 429
+        try:
+            future = service.model_server.submit(img, block=False)
+        except ServerBusy:
+            metrics.count("predict_requests", status="busy")
+            return JSONResponse(service.BUSY_RESPONSE, status_code=429, headers=service.BUSY_HEADERS)
+        with metrics.stage("predict.infer"):
+            result = await asyncio.wrap_future(future)
+
+        inline = service.INLINE_IMAGES or request.query_params.get("inline") == "1"
+        response = await run_in_threadpool(service.summarize, img, result, inline)
+        metrics.count("predict_requests", status="ok")
+        return JSONResponse(response)
+
+    except Exception as e:
+        metrics.count("predict_requests", status="error")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        await form.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/predict", predict, methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(service.app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+)
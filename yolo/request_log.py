@@ -0,0 +1,141 @@
+"""
+Append-only log of /predict results.
+
+Rows go into a SQLite table (WAL mode) instead of logs.xlsx, so logging a
+request costs the same however long the history is, and concurrent
+requests cannot corrupt the file. /predict only puts the row on a queue;
+one background thread writes queued rows in batches, one transaction
+per flush. The Excel file is produced on demand by export_excel().
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# ===================== SETTINGS =====================
+LOG_DB = "logs.db"
+TABLE = "predictions"
+FLUSH_INTERVAL_S = 1.0          # longest a row waits before being written
+MAX_BATCH = 500                 # rows per transaction at most
+# ====================================================
+
+_STOP = object()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class RequestLog:
+    def __init__(self, path=LOG_DB, import_excel=None,
+                 flush_interval_s=FLUSH_INTERVAL_S, max_batch=MAX_BATCH):
+        self.path = path
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._columns = []
+
+        new = not os.path.exists(path)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+            self._columns = [r[1] for r in conn.execute(f"PRAGMA table_info({TABLE})")][1:]
+        if new and import_excel and os.path.exists(import_excel):
+            self._import_excel(import_excel)
+
+        self._writer = threading.Thread(target=self._serve, name="request-log", daemon=True)
+        self._writer.start()
+
+    # ---------------- public API ----------------
+    def log(self, row):
+        """Queue one row ({column: value}); returns immediately."""
+        self._queue.put(dict(row))
+
+    def flush(self):
+        """Block until every row queued so far is on disk."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def to_dataframe(self, since=None):
+        """All logged rows (optionally from timestamp `since` on) in insert order."""
+        import pandas as pd
+
+        self.flush()
+        cols = ", ".join(_quote(c) for c in self._columns) or "id"
+        sql = f"SELECT {cols} FROM {TABLE}"
+        params = ()
+        if since is not None and "Timestamp" in self._columns:
+            sql += ' WHERE "Timestamp" >= ?'
+            params = (since,)
+        with self._connect() as conn:
+            return pd.read_sql_query(sql + " ORDER BY id", conn, params=params)
+
+    def export_excel(self, out_path, since=None):
+        """Write the log (same columns as the old logs.xlsx) to out_path."""
+        df = self.to_dataframe(since)
+        tmp = out_path + ".tmp.xlsx"
+        df.to_excel(tmp, index=False)
+        os.replace(tmp, out_path)
+        return out_path
+
+    # ---------------- internals ----------------
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _import_excel(self, xlsx_path):
+        """One-off migration of an existing logs.xlsx into a fresh database."""
+        import pandas as pd
+
+        df = pd.read_excel(xlsx_path)
+        rows = df.astype(object).where(df.notna(), None).to_dict("records")
+        with self._connect() as conn:
+            self._write(conn, rows)
+
+    def _add_columns(self, conn, rows):
+        for row in rows:
+            for name in row:
+                if name not in self._columns:
+                    conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(name)}")
+                    self._columns.append(name)
+
+    def _write(self, conn, rows):
+        self._add_columns(conn, rows)
+        cols = self._columns
+        sql = (f"INSERT INTO {TABLE} ({', '.join(_quote(c) for c in cols)}) "
+               f"VALUES ({', '.join('?' * len(cols))})")
+        with conn:
+            conn.executemany(sql, [tuple(r.get(c) for c in cols) for r in rows])
+
+    def _next_batch(self):
+        """Wait for one row, then collect whatever else arrives within the flush interval."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval_s
+        while batch[-1] is not _STOP and len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve(self):
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stop = False
+        while not stop:
+            batch = self._next_batch()
+            rows = [r for r in batch if r is not _STOP]
+            stop = len(rows) != len(batch)
+            try:
+                if rows:
+                    self._write(conn, rows)
+            except Exception as e:
+                print(f"[WARN] request log: {len(rows)} rows not written: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()